@@ -4,16 +4,99 @@ AI Chat System for Madame Leota
 Handles AI model loading and response generation
 """
 
+import re
+import copy
 import random
 import logging
-from typing import Optional
+import threading
+from importlib.util import find_spec
+from typing import Iterator, Optional
 
-try:
-    from transformers import AutoTokenizer, AutoModelForCausalLM
-    from ctransformers import AutoModelForCausalLM as CTAutoModelForCausalLM
-    TRANSFORMERS_AVAILABLE = True
-except ImportError:
-    TRANSFORMERS_AVAILABLE = False
+# Heavy model libraries are imported on first use; only check they are installed
+TRANSFORMERS_AVAILABLE = find_spec("transformers") is not None and find_spec("ctransformers") is not None
+ONNX_RUNTIME_AVAILABLE = find_spec("optimum") is not None and find_spec("onnxruntime") is not None
+
+# Extra KV-cache room reserved for the prompt on top of max_tokens
+_KV_PROMPT_BUDGET = 512
+
+# Seconds to wait for the next streamed chunk before giving up on generation
+_STREAM_TIMEOUT = 60.0
+
+# Sentence boundary used to split streamed model output
+_SENTENCE_END_RE = re.compile(r"[.!?]+\s")
+_SENTENCE_PUNCTUATION = ('.', '!', '?')
+
+# Keyword alternation used to classify user input for template responses;
+# the \w* suffix accepts inflections such as "jobs" or "relationships"
+_CATEGORY_RE = re.compile(
+    r"\b(?:(?P<love>love|romance|relationship|marriage)"
+    r"|(?P<career>career|job|work|business)"
+    r"|(?P<wealth>money|wealth|fortune|financial))\w*",
+    re.IGNORECASE
+)
+# Categories in the order they win when several appear in one input
+_CATEGORY_PRIORITY = ('love', 'career', 'wealth')
+
+_FALLBACKS = (
+    "The crystal ball is cloudy today... Let me try again.",
+    "The spirits are quiet... Please, ask me something else.",
+    "I sense interference in the mystical realm... Can you rephrase that?",
+    "The mists of time are unclear... Tell me more about what you seek."
+)
+
+_MYSTICAL_PHRASES = (
+    "The crystal ball reveals...",
+    "I see in the mists...",
+    "The spirits tell me...",
+    "My mystical senses detect...",
+    "The stars align to show..."
+)
+_MYSTICAL_RE = re.compile("|".join(map(re.escape, _MYSTICAL_PHRASES)))
+
+# Fortune details by category, shared across instances
+_FORTUNES = {
+    'love': (
+        "a mysterious stranger will enter your life",
+        "an old flame may rekindle",
+        "love is closer than you think",
+        "patience in matters of the heart will be rewarded"
+    ),
+    'career': (
+        "a new opportunity is on the horizon",
+        "your hard work will soon be recognized",
+        "a change in direction will lead to success",
+        "trust your instincts in professional matters"
+    ),
+    'wealth': (
+        "financial prosperity is within reach",
+        "an unexpected windfall may come your way",
+        "investments made now will bear fruit later",
+        "the universe is aligning for your financial success"
+    ),
+    'general': (
+        "the stars are aligning in your favor",
+        "a journey will bring unexpected rewards",
+        "trust in the signs the universe sends you",
+        "your destiny is unfolding exactly as it should"
+    )
+}
+
+class _SentenceEndCriteria:
+    """Stop transformers generation at the first sentence end past a token floor
+    
+    Follows the transformers StoppingCriteria call protocol without importing it
+    at module load.
+    """
+    
+    def __init__(self, stop_token_ids, prompt_length: int, min_new_tokens: int):
+        self.stop_token_ids = stop_token_ids
+        self.prompt_length = prompt_length
+        self.min_new_tokens = min_new_tokens
+    
+    def __call__(self, input_ids, scores, **kwargs) -> bool:
+        if input_ids.shape[-1] - self.prompt_length < self.min_new_tokens:
+            return False
+        return int(input_ids[0, -1]) in self.stop_token_ids
 
 class MadameLeotaAI:
     """AI system for Madame Leota's responses"""
@@ -23,9 +106,24 @@ class MadameLeotaAI:
         self.logger = logging.getLogger(__name__)
         self.model = None
         self.tokenizer = None
+        self._kv_cache = None
+        self._kv_cache_len = 0
+        self._stop_token_ids = frozenset()
+        self._prefix_ids = None
+        self._prefix_kv = None
+        self._quantized = False
         self.personality = config.get_personality()
         self.ai_config = config.get_ai_config()
         
+        # Private RNG so response selection doesn't share the global random state
+        self._rng = random.Random()
+        
+        # Cache template lookups used on every response
+        self._static_prefix = self._build_static_prefix()
+        self._greetings = self.personality["greetings"]
+        self._farewells = self.personality["farewells"]
+        self._fortune_formatters = config.get_fortune_formatters()
+        
         # Try to load AI model
         self._load_model()
     
@@ -38,19 +136,45 @@ class MadameLeotaAI:
                 if model_path.exists():
                     self.logger.info(f"Loading local model: {model_path}")
                     
+                    from transformers import AutoTokenizer, AutoModelForCausalLM
+                    from ctransformers import AutoModelForCausalLM as CTAutoModelForCausalLM
+                    
                     # Try ctransformers first (better for GGUF files)
                     try:
+                        ct_kwargs = {}
+                        model_file = self._find_quantized_file(model_path)
+                        if model_file:
+                            ct_kwargs["model_file"] = model_file
+                        
                         self.model = CTAutoModelForCausalLM.from_pretrained(
                             str(model_path),
                             model_type="llama",
-                            gpu_layers=0  # CPU only for Pi
+                            gpu_layers=0,  # CPU only for Pi
+                            threads=self.ai_config.get("threads", 4),
+                            context_length=self.ai_config.get("context_length", 512),
+                            **ct_kwargs
                         )
                         self.logger.info("✓ Model loaded with ctransformers")
                     except:
-                        # Fallback to transformers
+                        # Fallback to transformers, preferring ONNX Runtime on CPU
                         self.tokenizer = AutoTokenizer.from_pretrained(str(model_path))
-                        self.model = AutoModelForCausalLM.from_pretrained(str(model_path))
-                        self.logger.info("✓ Model loaded with transformers")
+                        # Every vocabulary piece ending a sentence, since SentencePiece
+                        # keeps separate ids for "▁." and a bare mid-text "."
+                        self._stop_token_ids = frozenset(
+                            token_id for token, token_id in self.tokenizer.get_vocab().items()
+                            if token.endswith(_SENTENCE_PUNCTUATION)
+                        )
+                        self._prefix_ids = self.tokenizer.encode(
+                            self._static_prefix, return_tensors="pt"
+                        )
+                        self._set_torch_threads()
+                        
+                        if not self._load_onnx_model(model_path):
+                            self.model = AutoModelForCausalLM.from_pretrained(str(model_path))
+                            self._quantize_transformers_model()
+                            self.logger.info("✓ Model loaded with transformers")
+                            self._init_kv_cache()
+                            self._compile_transformers_model()
                         
                 else:
                     self.logger.warning(f"Local model not found: {model_path}")
@@ -63,13 +187,151 @@ class MadameLeotaAI:
             self.logger.error(f"Failed to load AI model: {e}")
             self.logger.info("Using template-based responses")
     
+    def _find_quantized_file(self, model_path) -> Optional[str]:
+        """Pick the GGUF file matching the configured quantization from a model directory"""
+        if not model_path.is_dir():
+            return None
+        
+        quant = self.ai_config.get("quant", "")
+        matches = sorted(model_path.glob(f"*{quant}*.gguf")) or sorted(model_path.glob("*.gguf"))
+        if matches:
+            self.logger.info(f"Using quantized model file: {matches[0].name}")
+            return matches[0].name
+        return None
+    
+    def _set_torch_threads(self):
+        """Let torch use every configured CPU thread"""
+        try:
+            import torch
+            torch.set_num_threads(self.ai_config.get("threads", 4))
+        except Exception as e:
+            self.logger.warning(f"Could not set torch threads: {e}")
+    
+    def _load_onnx_model(self, model_path) -> bool:
+        """Load the transformers model through ONNX Runtime, exporting it on first use"""
+        if not ONNX_RUNTIME_AVAILABLE:
+            return False
+        
+        try:
+            from optimum.onnxruntime import ORTModelForCausalLM
+            
+            onnx_path = self.config.MODELS_DIR / "onnx" / model_path.stem
+            
+            if (onnx_path / "model.onnx").exists():
+                self.model = ORTModelForCausalLM.from_pretrained(
+                    str(onnx_path), provider="CPUExecutionProvider"
+                )
+            else:
+                self.logger.info(f"Exporting model to ONNX: {onnx_path}")
+                self.model = ORTModelForCausalLM.from_pretrained(
+                    str(model_path), export=True, provider="CPUExecutionProvider"
+                )
+                self.model.save_pretrained(str(onnx_path))
+            
+            self.logger.info("✓ Model loaded with ONNX Runtime")
+            return True
+            
+        except Exception as e:
+            self.logger.warning(f"ONNX Runtime load failed: {e}")
+            self.model = None
+            return False
+    
+    def _quantize_transformers_model(self):
+        """Apply int8 dynamic quantization to the transformers model on CPU"""
+        quant = self.ai_config.get("quant", "").upper()
+        if not quant.startswith(("Q8", "Q4", "INT8")):
+            return
+        
+        try:
+            import torch
+            self.model = torch.quantization.quantize_dynamic(
+                self.model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+            self._quantized = True
+            self.logger.info("✓ Model quantized to int8")
+        except Exception as e:
+            self.logger.warning(f"int8 quantization unavailable: {e}")
+    
+    def _compile_transformers_model(self):
+        """Compile the transformers forward pass with torch.compile (PyTorch 2.x)"""
+        if self._quantized:
+            # Dynamically quantized Linear layers do not trace reliably
+            self.logger.info("Skipping torch.compile for quantized model")
+            return
+        
+        eager_forward = self.model.forward
+        try:
+            import torch
+            if not hasattr(torch, "compile"):
+                return
+            
+            self.model.forward = torch.compile(
+                eager_forward, mode="reduce-overhead", fullgraph=False
+            )
+            # Compilation is lazy; run a short generate() through the same cache
+            # setup as a real turn so failures surface here
+            self.model.generate(
+                self._prefix_ids,
+                max_new_tokens=2,
+                pad_token_id=self.tokenizer.eos_token_id,
+                **self._cache_kwargs(self._prefix_ids)
+            )
+            self.logger.info("✓ Model forward compiled")
+        except Exception as e:
+            self.model.forward = eager_forward
+            self.logger.warning(f"torch.compile unavailable: {e}")
+    
+    def _init_kv_cache(self):
+        """Pre-allocate a static KV cache for the transformers model
+        
+        The static cache is reset every turn, so the persona prefix is prefilled
+        again each time; the reusable prefix cache is only the fallback for
+        transformers releases without StaticCache or when allocation fails.
+        """
+        try:
+            from transformers import StaticCache
+        except ImportError:
+            self._init_prefix_cache()
+            return
+        
+        try:
+            self._kv_cache_len = self.ai_config["max_tokens"] + _KV_PROMPT_BUDGET
+            self._kv_cache = StaticCache(
+                config=self.model.config,
+                max_batch_size=1,
+                max_cache_len=self._kv_cache_len,
+                device=self.model.device,
+                dtype=self.model.dtype
+            )
+            self.logger.info(f"✓ Static KV cache allocated ({self._kv_cache_len} tokens)")
+        except Exception as e:
+            self.logger.warning(f"Static KV cache unavailable: {e}")
+            self._kv_cache = None
+            self._init_prefix_cache()
+    
+    def _init_prefix_cache(self):
+        """Prefill the persona prefix once so later turns can skip it (no StaticCache)"""
+        try:
+            import torch
+            from transformers import DynamicCache
+            
+            cache = DynamicCache()
+            with torch.no_grad():
+                self.model(self._prefix_ids, past_key_values=cache, use_cache=True)
+            
+            self._prefix_kv = cache
+            self.logger.info(f"✓ Prompt prefix cached ({self._prefix_ids.shape[-1]} tokens)")
+        except Exception as e:
+            self.logger.warning(f"Prompt prefix cache unavailable: {e}")
+            self._prefix_kv = None
+    
     def get_welcome_message(self) -> str:
         """Get a welcome message from Madame Leota"""
-        return random.choice(self.personality["greetings"])
+        return self._rng.choice(self._greetings)
     
     def get_farewell_message(self) -> str:
         """Get a farewell message from Madame Leota"""
-        return random.choice(self.personality["farewells"])
+        return self._rng.choice(self._farewells)
     
     def get_response(self, user_input: str) -> str:
         """Generate a response to user input"""
@@ -83,34 +345,46 @@ class MadameLeotaAI:
             self.logger.error(f"Error generating response: {e}")
             return self._generate_fallback_response(user_input)
     
+    def stream_response(self, user_input: str) -> Iterator[str]:
+        """Yield the response sentence by sentence as it is generated"""
+        produced = False
+        try:
+            if self.model:
+                for sentence in self._stream_ai_response(user_input):
+                    produced = True
+                    yield sentence
+            else:
+                produced = True
+                yield self._generate_template_response(user_input)
+                
+        except Exception as e:
+            self.logger.error(f"Error streaming response: {e}")
+            if not produced:
+                yield self._generate_fallback_response(user_input)
+    
     def _generate_ai_response(self, user_input: str) -> str:
         """Generate response using AI model"""
         try:
-            prompt = self._create_prompt(user_input)
-            
-            if hasattr(self.model, 'generate'):  # transformers
-                inputs = self.tokenizer.encode(prompt, return_tensors="pt")
+            if self.tokenizer is not None:  # transformers
+                inputs = self._encode_prompt(user_input)
                 outputs = self.model.generate(
                     inputs,
                     max_length=len(inputs[0]) + self.ai_config["max_tokens"],
                     temperature=self.ai_config["temperature"],
                     top_p=self.ai_config["top_p"],
                     do_sample=True,
-                    pad_token_id=self.tokenizer.eos_token_id
+                    pad_token_id=self.tokenizer.eos_token_id,
+                    stopping_criteria=self._stopping_criteria(inputs),
+                    **self._cache_kwargs(inputs)
                 )
-                response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-                
-            else:  # ctransformers
-                response = self.model(
-                    prompt,
-                    max_new_tokens=self.ai_config["max_tokens"],
-                    temperature=self.ai_config["temperature"],
-                    top_p=self.ai_config["top_p"]
+                # Decode only the new tokens; the prompt may not round-trip verbatim
+                response = self.tokenizer.decode(
+                    outputs[0][inputs.shape[-1]:], skip_special_tokens=True
                 )
-            
-            # Extract just the response part
-            if prompt in response:
-                response = response[len(prompt):].strip()
+                
+            else:  # ctransformers streams only the generated text
+                prompt = self._create_prompt(user_input)
+                response = "".join(self._until_sentence_end(self._ctransformers_stream(prompt)))
             
             return self._format_response(response)
             
@@ -118,76 +392,154 @@ class MadameLeotaAI:
             self.logger.error(f"AI generation failed: {e}")
             return self._generate_template_response(user_input)
     
-    def _create_prompt(self, user_input: str) -> str:
-        """Create a prompt for the AI model"""
+    def _stream_ai_response(self, user_input: str) -> Iterator[str]:
+        """Stream the AI model output, yielding complete sentences"""
+        errors = []
+        if self.tokenizer is not None:  # transformers
+            from transformers import TextIteratorStreamer
+            
+            inputs = self._encode_prompt(user_input)
+            chunks = TextIteratorStreamer(
+                self.tokenizer, skip_prompt=True, skip_special_tokens=True,
+                timeout=_STREAM_TIMEOUT
+            )
+            generation = threading.Thread(
+                target=self._generate_into,
+                args=(chunks, errors),
+                kwargs=dict(
+                    inputs=inputs,
+                    max_length=len(inputs[0]) + self.ai_config["max_tokens"],
+                    temperature=self.ai_config["temperature"],
+                    top_p=self.ai_config["top_p"],
+                    do_sample=True,
+                    pad_token_id=self.tokenizer.eos_token_id,
+                    streamer=chunks,
+                    stopping_criteria=self._stopping_criteria(inputs),
+                    **self._cache_kwargs(inputs)
+                ),
+                daemon=True
+            )
+            generation.start()
+            
+        else:  # ctransformers
+            prompt = self._create_prompt(user_input)
+            chunks = self._until_sentence_end(self._ctransformers_stream(prompt))
+        
+        first = True
+        buffer = ""
+        for chunk in chunks:
+            buffer += chunk
+            
+            match = _SENTENCE_END_RE.search(buffer)
+            while match:
+                sentence, buffer = buffer[:match.end()].strip(), buffer[match.end():]
+                if sentence:
+                    yield self._format_response(sentence) if first else sentence
+                    first = False
+                match = _SENTENCE_END_RE.search(buffer)
+        
+        if errors:
+            raise errors[0]
+        
+        tail = buffer.strip()
+        if tail:
+            yield self._format_response(tail) if first else tail
+    
+    def _generate_into(self, chunks, errors, **kwargs):
+        """Run generate() for a streamer, ending the stream if generation fails"""
+        try:
+            self.model.generate(**kwargs)
+        except Exception as e:
+            # Hand the error to the consumer instead of leaving it blocked on the streamer
+            errors.append(e)
+            chunks.end()
+    
+    def _ctransformers_stream(self, prompt: str) -> Iterator[str]:
+        """Stream tokens from the ctransformers model"""
+        return self.model(
+            prompt,
+            max_new_tokens=self.ai_config["max_tokens"],
+            temperature=self.ai_config["temperature"],
+            top_p=self.ai_config["top_p"],
+            stream=True
+        )
+    
+    def _until_sentence_end(self, tokens: Iterator[str]) -> Iterator[str]:
+        """Pass tokens through, stopping at the first sentence end past the token floor"""
+        min_tokens = self.ai_config.get("min_tokens", 20)
+        for count, token in enumerate(tokens, 1):
+            yield token
+            if count >= min_tokens and token.rstrip().endswith(_SENTENCE_PUNCTUATION):
+                break
+    
+    def _stopping_criteria(self, inputs):
+        """Build the sentence-end stopping criteria for transformers generation"""
+        if not self._stop_token_ids:
+            return None
+        
+        from transformers import StoppingCriteriaList
+        
+        return StoppingCriteriaList([
+            _SentenceEndCriteria(
+                self._stop_token_ids, len(inputs[0]), self.ai_config.get("min_tokens", 20)
+            )
+        ])
+    
+    def _cache_kwargs(self, inputs) -> dict:
+        """Reuse the pre-allocated KV buffers or the cached prompt prefix"""
+        if self._kv_cache is not None and \
+                len(inputs[0]) + self.ai_config["max_tokens"] <= self._kv_cache_len:
+            self._kv_cache.reset()
+            return {"past_key_values": self._kv_cache, "use_cache": True}
+        
+        if self._prefix_kv is not None:
+            # generate() extends the cache, so each turn gets its own copy
+            return {"past_key_values": copy.deepcopy(self._prefix_kv), "use_cache": True}
+        
+        return {}
+    
+    def _build_static_prefix(self) -> str:
+        """Build the persona block that starts every prompt"""
         personality = self.personality
         
-        prompt = f"""You are {personality['name']}, a {personality['style']}. 
+        return f"""You are {personality['name']}, a {personality['style']}. 
 You speak in a {personality['tone']} manner.
 
-User: {user_input}
+"""
+    
+    def _user_suffix(self, user_input: str) -> str:
+        """Build the per-turn part of the prompt"""
+        return f"""User: {user_input}
 
-{personality['name']}:"""
+{self.personality['name']}:"""
+    
+    def _create_prompt(self, user_input: str) -> str:
+        """Create a prompt for the AI model"""
+        return self._static_prefix + self._user_suffix(user_input)
+    
+    def _encode_prompt(self, user_input: str):
+        """Tokenize a prompt, reusing the cached prefix token ids"""
+        import torch
         
-        return prompt
+        suffix_ids = self.tokenizer.encode(
+            self._user_suffix(user_input), return_tensors="pt", add_special_tokens=False
+        )
+        return torch.cat([self._prefix_ids, suffix_ids], dim=1)
     
     def _generate_template_response(self, user_input: str) -> str:
         """Generate response using templates"""
-        user_input_lower = user_input.lower()
-        
         # Fortune templates
-        if any(word in user_input_lower for word in ['love', 'romance', 'relationship', 'marriage']):
-            return self._get_fortune('love')
-        elif any(word in user_input_lower for word in ['career', 'job', 'work', 'business']):
-            return self._get_fortune('career')
-        elif any(word in user_input_lower for word in ['money', 'wealth', 'fortune', 'financial']):
-            return self._get_fortune('wealth')
-        else:
-            return self._get_fortune('general')
+        found = {match.lastgroup for match in _CATEGORY_RE.finditer(user_input)}
+        fortune_type = next((c for c in _CATEGORY_PRIORITY if c in found), 'general')
+        return self._get_fortune(fortune_type)
     
     def _get_fortune(self, fortune_type: str) -> str:
         """Get a fortune of the specified type"""
-        template = self.personality["fortune_templates"][fortune_type]
-        
-        fortunes = {
-            'love': [
-                "a mysterious stranger will enter your life",
-                "an old flame may rekindle",
-                "love is closer than you think",
-                "patience in matters of the heart will be rewarded"
-            ],
-            'career': [
-                "a new opportunity is on the horizon",
-                "your hard work will soon be recognized",
-                "a change in direction will lead to success",
-                "trust your instincts in professional matters"
-            ],
-            'wealth': [
-                "financial prosperity is within reach",
-                "an unexpected windfall may come your way",
-                "investments made now will bear fruit later",
-                "the universe is aligning for your financial success"
-            ],
-            'general': [
-                "the stars are aligning in your favor",
-                "a journey will bring unexpected rewards",
-                "trust in the signs the universe sends you",
-                "your destiny is unfolding exactly as it should"
-            ]
-        }
-        
-        detail = random.choice(fortunes[fortune_type])
-        return template.format(details=detail)
+        return self._fortune_formatters[fortune_type](details=self._rng.choice(_FORTUNES[fortune_type]))
     
     def _generate_fallback_response(self, user_input: str) -> str:
         """Generate a fallback response when all else fails"""
-        fallbacks = [
-            "The crystal ball is cloudy today... Let me try again.",
-            "The spirits are quiet... Please, ask me something else.",
-            "I sense interference in the mystical realm... Can you rephrase that?",
-            "The mists of time are unclear... Tell me more about what you seek."
-        ]
-        return random.choice(fallbacks)
+        return self._rng.choice(_FALLBACKS)
     
     def _format_response(self, response: str) -> str:
         """Format the AI response to match Madame Leota's style"""
@@ -195,15 +547,7 @@ User: {user_input}
         response = response.strip()
         
         # Add mystical touches if not present
-        mystical_phrases = [
-            "The crystal ball reveals...",
-            "I see in the mists...",
-            "The spirits tell me...",
-            "My mystical senses detect...",
-            "The stars align to show..."
-        ]
-        
-        if not any(phrase in response for phrase in mystical_phrases):
-            response = f"{random.choice(mystical_phrases)} {response}"
+        if not _MYSTICAL_RE.search(response):
+            response = f"{self._rng.choice(_MYSTICAL_PHRASES)} {response}"
         
         return response
@@ -4,16 +4,75 @@ Speech Recognition for Madame Leota
 Handles listening to user input
 """
 
+import json
 import logging
 import time
+import warnings
 from typing import Optional
 
+try:
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        import audioop
+    AUDIOOP_AVAILABLE = True
+except ImportError:
+    AUDIOOP_AVAILABLE = False
+
 try:
     import speech_recognition as sr
     SPEECH_REC_AVAILABLE = True
 except ImportError:
     SPEECH_REC_AVAILABLE = False
 
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+try:
+    import vosk
+    VOSK_AVAILABLE = True
+except ImportError:
+    VOSK_AVAILABLE = False
+
+try:
+    import webrtcvad
+    import sounddevice
+    STREAMING_AVAILABLE = True
+except ImportError:
+    STREAMING_AVAILABLE = False
+
+# Streaming STT parameters: 30 ms int16 frames at 16 kHz
+_STREAM_RATE = 16000
+_STREAM_FRAME = 480
+_STREAM_SILENCE_FRAMES = 17  # ~500 ms of trailing silence ends an utterance
+
+# Consecutive failed transcriptions before recalibrating for ambient noise
+_RECALIBRATE_AFTER = 3
+
+# Energy threshold is set this far above the measured ambient RMS
+_AMBIENT_RATIO = 1.5
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True, fastmath=True)
+    def _rms(samples):
+        """Root-mean-square of float32 samples"""
+        total = 0.0
+        for sample in samples:
+            total += sample * sample
+        return (total / len(samples)) ** 0.5
+elif NUMPY_AVAILABLE:
+    def _rms(samples):
+        """Root-mean-square of float32 samples"""
+        return float(np.sqrt(np.mean(samples * samples)))
+
 class SpeechRecognizer:
     """Speech recognition system for Madame Leota"""
     
@@ -23,9 +82,11 @@ class SpeechRecognizer:
         self.recognizer = None
         self.microphone = None
         self.audio_config = config.get_audio_config()
+        self._vosk = None
         
         if SPEECH_REC_AVAILABLE:
             self._initialize_speech_recognition()
+            self._initialize_vosk()
         else:
             self.logger.warning("Speech recognition not available")
     
@@ -36,21 +97,54 @@ class SpeechRecognizer:
             self.recognizer.energy_threshold = 4000
             self.recognizer.dynamic_energy_threshold = True
             self.recognizer.pause_threshold = 0.8
+            self.recognizer.non_speaking_duration = 0.3
             
             # Get microphone
             self.microphone = sr.Microphone()
             
             # Adjust for ambient noise
             with self.microphone as source:
-                self.recognizer.adjust_for_ambient_noise(source, duration=1)
+                self._calibrate_energy_threshold(source, duration=0.5)
             
             self.logger.info("✓ Speech recognition initialized")
             
         except Exception as e:
             self.logger.error(f"Failed to initialize speech recognition: {e}")
     
-    def listen_for_speech(self, timeout: int = 5) -> Optional[str]:
-        """Listen for speech input and return transcribed text"""
+    def _calibrate_energy_threshold(self, source, duration: float):
+        """Set the energy threshold from the RMS of a short ambient capture"""
+        if not NUMPY_AVAILABLE:
+            self.recognizer.adjust_for_ambient_noise(source, duration=duration)
+            return
+        
+        frames = max(1, int(duration * source.SAMPLE_RATE / source.CHUNK))
+        raw = b"".join(source.stream.read(source.CHUNK) for _ in range(frames))
+        samples = np.frombuffer(raw, dtype=np.int16).astype(np.float32)
+        
+        self.recognizer.energy_threshold = _rms(samples) * _AMBIENT_RATIO
+        self.logger.info(f"Energy threshold set to {self.recognizer.energy_threshold:.0f}")
+    
+    def _initialize_vosk(self):
+        """Load the offline Vosk model if present"""
+        if not VOSK_AVAILABLE:
+            return
+        
+        try:
+            model_path = self.config.MODELS_DIR / self.audio_config.get("vosk_model", "vosk-small-en")
+            
+            if model_path.exists():
+                vosk.SetLogLevel(-1)
+                self._vosk = vosk.Model(str(model_path))
+                self.logger.info(f"✓ Offline speech recognition loaded: {model_path.name}")
+            else:
+                self.logger.info(f"Vosk model not found: {model_path} - using online recognition")
+                
+        except Exception as e:
+            self.logger.error(f"Failed to load Vosk model: {e}")
+            self._vosk = None
+    
+    def listen_for_speech(self, timeout: Optional[float] = None) -> Optional[str]:
+        """Listen for speech input and return transcribed text (blocks until understood without a timeout)"""
         if not self.recognizer or not self.microphone:
             self.logger.warning("Speech recognition not available")
             return None
@@ -59,17 +153,24 @@ class SpeechRecognizer:
             self.logger.info("Listening for speech...")
             
             with self.microphone as source:
-                audio = self.recognizer.listen(source, timeout=timeout)
-            
-            self.logger.info("Audio captured, transcribing...")
-            text = self._transcribe_audio(audio)
-            
-            if text:
-                self.logger.info(f"Transcribed: {text}")
-                return text
-            else:
-                self.logger.info("No speech detected")
-                return None
+                while True:
+                    # The recognizer's energy VAD blocks until a phrase ends
+                    audio = self.recognizer.listen(
+                        source,
+                        timeout=timeout,
+                        phrase_time_limit=self.audio_config["phrase_time_limit"]
+                    )
+                    
+                    self.logger.info("Audio captured, transcribing...")
+                    text = self._transcribe_audio(audio)
+                    
+                    if text:
+                        self.logger.info(f"Transcribed: {text}")
+                        return text
+                    
+                    self.logger.info("No speech detected")
+                    if timeout is not None:
+                        return None
                 
         except sr.WaitTimeoutError:
             self.logger.info("No speech detected within timeout")
@@ -80,6 +181,17 @@ class SpeechRecognizer:
     
     def _transcribe_audio(self, audio) -> Optional[str]:
         """Transcribe audio to text"""
+        # Skip recognition entirely for captures no louder than the ambient noise
+        if self._is_silent(audio):
+            self.logger.info("Captured audio is below the noise floor")
+            return None
+        
+        # Try offline Vosk first, keeping Google for low-confidence results
+        if self._vosk:
+            text = self._transcribe_vosk(audio)
+            if text:
+                return text
+        
         try:
             # Try Google Speech Recognition first
             text = self.recognizer.recognize_google(
@@ -102,6 +214,44 @@ class SpeechRecognizer:
                 self.logger.error(f"Sphinx recognition failed: {sphinx_error}")
                 return None
     
+    def _is_silent(self, audio) -> bool:
+        """Check whether a capture's RMS is at or below the ambient noise level"""
+        noise_floor = self.recognizer.energy_threshold / _AMBIENT_RATIO
+        raw = audio.get_raw_data()
+        
+        if AUDIOOP_AVAILABLE:
+            level = audioop.rms(raw, audio.sample_width)
+        elif NUMPY_AVAILABLE and audio.sample_width == 2:
+            level = _rms(np.frombuffer(raw, dtype=np.int16).astype(np.float32))
+        else:
+            return False
+        
+        return level <= noise_floor
+    
+    def _transcribe_vosk(self, audio) -> Optional[str]:
+        """Transcribe audio locally with Vosk"""
+        try:
+            recognizer = vosk.KaldiRecognizer(self._vosk, 16000)
+            recognizer.SetWords(True)
+            recognizer.AcceptWaveform(audio.get_raw_data(convert_rate=16000, convert_width=2))
+            result = json.loads(recognizer.FinalResult())
+            
+            text = result.get("text", "").strip()
+            words = result.get("result", [])
+            if not text or not words:
+                return None
+            
+            confidence = sum(word.get("conf", 0.0) for word in words) / len(words)
+            if confidence < self.audio_config.get("vosk_min_confidence", 0.6):
+                self.logger.info(f"Vosk confidence too low ({confidence:.2f})")
+                return None
+            
+            return text
+            
+        except Exception as e:
+            self.logger.error(f"Vosk recognition failed: {e}")
+            return None
+    
     def start_continuous_listening(self, callback):
         """Start continuous listening for speech"""
         if not self.recognizer or not self.microphone:
@@ -111,15 +261,34 @@ class SpeechRecognizer:
         try:
             self.logger.info("Starting continuous listening...")
             
+            if self._vosk and STREAMING_AVAILABLE:
+                # Stream VAD-gated audio straight into Vosk
+                import threading
+                thread = threading.Thread(
+                    target=self._stream_listen_loop, args=(callback,), daemon=True
+                )
+                thread.start()
+                return True
+            
             def listen_loop():
+                misses = 0
                 while True:
                     try:
+                        # Keep the microphone stream open across utterances
                         with self.microphone as source:
-                            audio = self.recognizer.listen(source)
-                        
-                        text = self._transcribe_audio(audio)
-                        if text:
-                            callback(text)
+                            while True:
+                                audio = self.recognizer.listen(source)
+                                
+                                text = self._transcribe_audio(audio)
+                                if text:
+                                    misses = 0
+                                    callback(text)
+                                    continue
+                                
+                                misses += 1
+                                if misses >= _RECALIBRATE_AFTER:
+                                    self._calibrate_energy_threshold(source, duration=0.5)
+                                    misses = 0
                             
                     except Exception as e:
                         self.logger.error(f"Error in continuous listening: {e}")
@@ -136,6 +305,51 @@ class SpeechRecognizer:
             self.logger.error(f"Failed to start continuous listening: {e}")
             return False
     
+    def _stream_listen_loop(self, callback):
+        """Feed voiced microphone frames to Vosk as they arrive"""
+        vad = webrtcvad.Vad(2)
+        recognizer = vosk.KaldiRecognizer(self._vosk, _STREAM_RATE)
+        in_speech = False
+        silent_frames = 0
+        
+        while True:
+            try:
+                with sounddevice.RawInputStream(
+                    samplerate=_STREAM_RATE, blocksize=_STREAM_FRAME,
+                    dtype='int16', channels=1
+                ) as stream:
+                    while True:
+                        data, _ = stream.read(_STREAM_FRAME)
+                        frame = bytes(data)
+                        
+                        if vad.is_speech(frame, _STREAM_RATE):
+                            in_speech = True
+                            silent_frames = 0
+                        elif in_speech:
+                            silent_frames += 1
+                        
+                        if not in_speech:
+                            continue
+                        
+                        # Vosk decodes incrementally while the user is speaking
+                        if recognizer.AcceptWaveform(frame):
+                            result = json.loads(recognizer.Result())
+                        elif silent_frames > _STREAM_SILENCE_FRAMES:
+                            result = json.loads(recognizer.FinalResult())
+                        else:
+                            continue
+                        
+                        in_speech = False
+                        silent_frames = 0
+                        
+                        text = result.get("text", "").strip()
+                        if text:
+                            callback(text)
+                            
+            except Exception as e:
+                self.logger.error(f"Error in streaming recognition: {e}")
+                time.sleep(1)
+    
     def adjust_for_noise(self):
         """Adjust microphone for ambient noise"""
         if not self.recognizer or not self.microphone:
@@ -143,7 +357,7 @@ class SpeechRecognizer:
         
         try:
             with self.microphone as source:
-                self.recognizer.adjust_for_ambient_noise(source, duration=2)
+                self._calibrate_energy_threshold(source, duration=2)
             self.logger.info("✓ Microphone adjusted for ambient noise")
             return True
         except Exception as e:
@@ -184,7 +398,7 @@ class FallbackSpeechRecognizer:
         self.config = config
         self.logger = logging.getLogger(__name__)
     
-    def listen_for_speech(self, timeout: int = 5) -> Optional[str]:
+    def listen_for_speech(self, timeout: Optional[float] = None) -> Optional[str]:
         """Fallback method - returns None"""
         self.logger.warning("Using fallback speech recognizer - no speech input available")
         return None
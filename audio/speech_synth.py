@@ -4,23 +4,31 @@ Speech Synthesis for Madame Leota
 Handles text-to-speech conversion
 """
 
+import io
+import hashlib
+import functools
 import logging
+import queue
 import time
 import threading
+from importlib.util import find_spec
 from typing import Optional
 
-try:
-    import pyttsx3
-    PYTTSX3_AVAILABLE = True
-except ImportError:
-    PYTTSX3_AVAILABLE = False
+# Engines are imported on first use; only check they are installed
+PYTTSX3_AVAILABLE = find_spec("pyttsx3") is not None
+GTTS_AVAILABLE = find_spec("gtts") is not None and find_spec("pygame") is not None
+NUMPY_AVAILABLE = find_spec("numpy") is not None
 
-try:
-    from gtts import gTTS
+# Audio levels are reported to listeners once per animation frame
+_LEVEL_INTERVAL = 1.0 / 30
+
+@functools.lru_cache(maxsize=None)
+def _mixer():
+    """Import pygame's mixer once, pre-configured for gTTS playback"""
     import pygame.mixer
-    GTTS_AVAILABLE = True
-except ImportError:
-    GTTS_AVAILABLE = False
+    # Match gTTS output (24 kHz mono) and use a small buffer for low playback latency
+    pygame.mixer.pre_init(frequency=24000, size=-16, channels=1, buffer=1024)
+    return pygame.mixer
 
 class SpeechSynthesizer:
     """Speech synthesis system for Madame Leota"""
@@ -30,9 +38,29 @@ class SpeechSynthesizer:
         self.logger = logging.getLogger(__name__)
         self.engine = None
         self.audio_config = config.get_audio_config()
-        self._speaking = False
         self.speech_thread = None
         
+        # Set while idle; cleared for as long as an utterance is playing
+        self._done = threading.Event()
+        self._done.set()
+        self._speech_queue = queue.Queue()
+        self._queue_thread = None
+        
+        # pyttsx3 utterances are handed to a single engine loop thread
+        self._utterances = queue.Queue()
+        self._utterance_lock = threading.Lock()
+        self._pending_utterances = 0
+        
+        # Listeners for per-chunk audio levels; None is sent once speech ends
+        self._audio_callbacks = []
+        self._playback_stop = threading.Event()
+        
+        # gTTS output cache: in-memory LRU; only the canned phrases persist to disk
+        personality = config.get_personality()
+        self._canned_phrases = frozenset(personality["greetings"]) | frozenset(personality["farewells"])
+        self._tts_cache_dir = config.MODELS_DIR / "tts_cache"
+        self._tts_cache = functools.lru_cache(maxsize=256)(self._synth_gtts_bytes)
+        
         if PYTTSX3_AVAILABLE:
             self._initialize_pyttsx3()
         elif GTTS_AVAILABLE:
@@ -43,6 +71,7 @@ class SpeechSynthesizer:
     def _initialize_pyttsx3(self):
         """Initialize pyttsx3 engine"""
         try:
+            import pyttsx3
             self.engine = pyttsx3.init()
             
             # Configure voice properties
@@ -66,20 +95,108 @@ class SpeechSynthesizer:
             self.engine.setProperty('rate', int(200 * self.audio_config["voice_speed"]))
             self.engine.setProperty('volume', self.audio_config["voice_volume"])
             
+            # Run the engine's own event loop once instead of runAndWait per utterance
+            self.engine.connect('started-word', self._on_word_start)
+            self.engine.connect('finished-utterance', self._on_utterance_end)
+            self.engine.startLoop(False)
+            threading.Thread(target=self._pyttsx3_loop, daemon=True).start()
+            
             self.logger.info("✓ pyttsx3 speech synthesis initialized")
             
         except Exception as e:
             self.logger.error(f"Failed to initialize pyttsx3: {e}")
             self.engine = None
     
+    def _pyttsx3_loop(self):
+        """Pump the pyttsx3 driver loop and feed it queued utterances"""
+        while True:
+            try:
+                while True:
+                    self.engine.say(self._utterances.get_nowait())
+            except queue.Empty:
+                pass
+            
+            try:
+                self.engine.iterate()
+            except Exception as e:
+                self.logger.error(f"pyttsx3 loop error: {e}")
+            
+            time.sleep(0.01)
+    
+    def _on_word_start(self, name, location, length):
+        """Report full level while pyttsx3 is voicing a word"""
+        self._emit_audio_level(1.0)
+    
+    def _on_utterance_end(self, name, completed):
+        """Mark an utterance as finished"""
+        with self._utterance_lock:
+            self._pending_utterances = max(0, self._pending_utterances - 1)
+            finished = self._pending_utterances == 0
+            if finished:
+                self._done.set()
+        
+        # Listeners may block (e.g. joining the animation thread), so call them unlocked
+        if finished:
+            self._emit_audio_level(None)
+    
+    def on_audio_chunk(self, callback):
+        """Register a callback receiving the audio level (0-1) of each spoken chunk"""
+        self._audio_callbacks.append(callback)
+    
+    def _emit_audio_level(self, level: Optional[float]):
+        """Send an audio level to registered listeners"""
+        for callback in self._audio_callbacks:
+            try:
+                callback(level)
+            except Exception as e:
+                self.logger.error(f"Audio level callback error: {e}")
+    
     def _initialize_gtts(self):
         """Initialize gTTS and pygame mixer"""
         try:
-            pygame.mixer.init()
+            _mixer().init()
             self.logger.info("✓ gTTS speech synthesis initialized")
+            
+            # Pre-synthesize the canned phrases in the background
+            threading.Thread(target=self._warm_tts_cache, daemon=True).start()
         except Exception as e:
             self.logger.error(f"Failed to initialize gTTS: {e}")
     
+    def _synth_gtts_bytes(self, text: str, lang: str) -> bytes:
+        """Synthesize text to mp3 bytes; canned phrases are also kept on disk"""
+        persist = text in self._canned_phrases
+        key = hashlib.blake2b(f"{lang}:{text}".encode(), digest_size=16).hexdigest()
+        cache_file = self._tts_cache_dir / f"{key}.mp3"
+        
+        if persist and cache_file.exists():
+            return cache_file.read_bytes()
+        
+        from gtts import gTTS
+        tts = gTTS(text=text, lang=lang)
+        buffer = io.BytesIO()
+        tts.write_to_fp(buffer)
+        audio_bytes = buffer.getvalue()
+        
+        if persist:
+            try:
+                self._tts_cache_dir.mkdir(parents=True, exist_ok=True)
+                cache_file.write_bytes(audio_bytes)
+            except OSError as e:
+                self.logger.warning(f"Could not write TTS cache file: {e}")
+        
+        return audio_bytes
+    
+    def _warm_tts_cache(self):
+        """Synthesize greetings and farewells ahead of time"""
+        lang = self.audio_config["language"][:2]
+        
+        for text in self._canned_phrases:
+            try:
+                self._tts_cache(text, lang)
+            except Exception as e:
+                self.logger.warning(f"TTS cache warm-up stopped: {e}")
+                break
+    
     def speak(self, text: str, blocking: bool = True) -> bool:
         """Convert text to speech and play it"""
         if not text:
@@ -98,103 +215,152 @@ class SpeechSynthesizer:
             self.logger.error(f"Error in speech synthesis: {e}")
             return False
     
+    def queue_speech(self, text: str) -> bool:
+        """Queue text to be spoken in order by a background worker"""
+        if not text:
+            return False
+        
+        self._speech_queue.put(text)
+        
+        if not self._queue_thread or not self._queue_thread.is_alive():
+            self._queue_thread = threading.Thread(target=self._speech_worker, daemon=True)
+            self._queue_thread.start()
+        
+        return True
+    
+    def _speech_worker(self):
+        """Speak queued text one item at a time"""
+        while True:
+            text = self._speech_queue.get()
+            try:
+                self.speak(text, blocking=True)
+            finally:
+                self._speech_queue.task_done()
+    
     def _speak_pyttsx3(self, text: str, blocking: bool) -> bool:
         """Speak using pyttsx3"""
         try:
+            with self._utterance_lock:
+                self._pending_utterances += 1
+                self._done.clear()
+            
+            self._utterances.put(text)
+            
             if blocking:
-                self._speaking = True
-                self.engine.say(text)
-                self.engine.runAndWait()
-                self._speaking = False
-                return True
-            else:
-                # Non-blocking speech
-                self._speaking = True
-                
-                def speak_thread():
-                    try:
-                        self.engine.say(text)
-                        self.engine.runAndWait()
-                    finally:
-                        self._speaking = False
-                
-                self.speech_thread = threading.Thread(target=speak_thread, daemon=True)
-                self.speech_thread.start()
-                return True
+                self._done.wait()
+            
+            return True
                 
         except Exception as e:
             self.logger.error(f"pyttsx3 speech error: {e}")
-            self._speaking = False
+            self._done.set()
             return False
     
     def _speak_gtts(self, text: str, blocking: bool) -> bool:
         """Speak using gTTS"""
         try:
-            # Create temporary audio file
-            import tempfile
-            import os
+            # Generate speech into memory, reusing cached audio for repeated text
+            audio_bytes = self._tts_cache(text, self.audio_config["language"][:2])
+            sound = _mixer().Sound(file=io.BytesIO(audio_bytes))
+            
+            levels = self._audio_levels(sound) if self._audio_callbacks else ()
+            
+            # Play audio; the tracker sets the event when the clip ends or speech is stopped
+            self._playback_stop.set()
+            self._playback_stop = threading.Event()
             
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3') as temp_file:
-                temp_path = temp_file.name
+            self._done.clear()
+            sound.play()
             
-            # Generate speech
-            tts = gTTS(text=text, lang=self.audio_config["language"][:2])
-            tts.save(temp_path)
+            self.speech_thread = threading.Thread(
+                target=self._track_playback,
+                args=(self._playback_stop, sound.get_length(), levels),
+                daemon=True
+            )
+            self.speech_thread.start()
             
-            # Play audio
             if blocking:
-                self._speaking = True
-                pygame.mixer.music.load(temp_path)
-                pygame.mixer.music.play()
-                
-                while pygame.mixer.music.get_busy():
-                    time.sleep(0.1)
-                
-                self._speaking = False
-                
-                # Clean up
-                pygame.mixer.music.unload()
-                os.unlink(temp_path)
-                return True
-            else:
-                # Non-blocking speech
-                self._speaking = True
-                
-                def play_thread():
-                    try:
-                        pygame.mixer.music.load(temp_path)
-                        pygame.mixer.music.play()
-                        
-                        while pygame.mixer.music.get_busy():
-                            time.sleep(0.1)
-                        
-                        # Clean up
-                        pygame.mixer.music.unload()
-                        os.unlink(temp_path)
-                    finally:
-                        self._speaking = False
-                
-                self.speech_thread = threading.Thread(target=play_thread, daemon=True)
-                self.speech_thread.start()
-                return True
+                self._done.wait()
+            
+            return True
                 
         except Exception as e:
             self.logger.error(f"gTTS speech error: {e}")
-            self._speaking = False
+            self._done.set()
             return False
     
+    def _audio_levels(self, sound) -> list:
+        """Compute normalized RMS levels of a clip, one per level interval"""
+        if not NUMPY_AVAILABLE:
+            return []
+        
+        try:
+            import numpy as np
+            import pygame.sndarray
+            
+            samples = pygame.sndarray.array(sound).astype(np.float32)
+            if samples.ndim > 1:
+                samples = samples.mean(axis=1)
+            
+            step = max(1, int(_mixer().get_init()[0] * _LEVEL_INTERVAL))
+            count = len(samples) // step
+            if count == 0:
+                return []
+            
+            chunks = samples[:count * step].reshape(count, step)
+            rms = np.sqrt(np.mean(chunks * chunks, axis=1))
+            peak = rms.max()
+            return (rms / peak).tolist() if peak > 0 else rms.tolist()
+            
+        except Exception as e:
+            self.logger.error(f"Error computing audio levels: {e}")
+            return []
+    
+    def _track_playback(self, stop: threading.Event, length: float, levels):
+        """Report audio levels in step with playback, then mark the clip finished"""
+        start = time.monotonic()
+        
+        for i, level in enumerate(levels):
+            if stop.wait(max(0.0, start + i * _LEVEL_INTERVAL - time.monotonic())):
+                break
+            self._emit_audio_level(level)
+        else:
+            stop.wait(max(0.0, start + length - time.monotonic()))
+        
+        # A newer clip owns the event once it has replaced this one
+        if stop is self._playback_stop:
+            self._done.set()
+            self._emit_audio_level(None)
+    
     def stop_speech(self):
         """Stop current speech"""
         try:
+            # Drop anything still waiting to be spoken
+            while True:
+                try:
+                    self._speech_queue.get_nowait()
+                    self._speech_queue.task_done()
+                except queue.Empty:
+                    break
+            
             if self.engine and PYTTSX3_AVAILABLE:
+                while True:
+                    try:
+                        self._utterances.get_nowait()
+                    except queue.Empty:
+                        break
+                
                 self.engine.stop()
+                
+                with self._utterance_lock:
+                    self._pending_utterances = 0
+                
+                self._emit_audio_level(None)
             elif GTTS_AVAILABLE:
-                pygame.mixer.music.stop()
-            
-            self._speaking = False
+                _mixer().stop()
+                self._playback_stop.set()
             
-            if self.speech_thread and self.speech_thread.is_alive():
-                self.speech_thread.join(timeout=1)
+            self._done.set()
             
             self.logger.info("✓ Speech stopped")
             
@@ -205,7 +371,7 @@ class SpeechSynthesizer:
         """Pause current speech"""
         try:
             if GTTS_AVAILABLE:
-                pygame.mixer.music.pause()
+                _mixer().pause()
                 self.logger.info("✓ Speech paused")
             else:
                 self.logger.warning("Pause not supported with current speech engine")
@@ -217,7 +383,7 @@ class SpeechSynthesizer:
         """Resume paused speech"""
         try:
             if GTTS_AVAILABLE:
-                pygame.mixer.music.unpause()
+                _mixer().unpause()
                 self.logger.info("✓ Speech resumed")
             else:
                 self.logger.warning("Resume not supported with current speech engine")
@@ -227,7 +393,22 @@ class SpeechSynthesizer:
     
     def is_speaking(self) -> bool:
         """Check if currently speaking"""
-        return self._speaking  # Changed from self.is_speaking to self._speaking
+        return not self._done.is_set() or self._speech_queue.unfinished_tasks > 0
+    
+    def wait_until_done(self, timeout: Optional[float] = None) -> bool:
+        """Block until queued and current speech has finished"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        
+        def remaining():
+            return None if deadline is None else max(0.0, deadline - time.monotonic())
+        
+        with self._speech_queue.all_tasks_done:
+            while self._speech_queue.unfinished_tasks:
+                if deadline is not None and remaining() == 0.0:
+                    return False
+                self._speech_queue.all_tasks_done.wait(remaining())
+        
+        return self._done.wait(remaining())
     
     def set_voice_speed(self, speed: float):
         """Set voice speed (0.5 to 2.0)"""
@@ -286,6 +467,10 @@ class FallbackSpeechSynthesizer:
         self.logger.warning(f"Fallback speech synthesizer: {text}")
         return True
     
+    def queue_speech(self, text: str) -> bool:
+        """Fallback method - just prints text"""
+        return self.speak(text)
+    
     def stop_speech(self):
         """Fallback method"""
         pass
@@ -293,3 +478,11 @@ class FallbackSpeechSynthesizer:
     def is_speaking(self) -> bool:
         """Fallback method"""
         return False
+    
+    def on_audio_chunk(self, callback):
+        """Fallback method"""
+        pass
+    
+    def wait_until_done(self, timeout: Optional[float] = None) -> bool:
+        """Fallback method"""
+        return True
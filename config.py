@@ -4,91 +4,187 @@ Configuration settings for Madame Leota AI Fortune Teller
 """
 
 import os
+import re
+import stat
+import shutil
+import string
+import subprocess
+import tempfile
+from functools import cached_property, lru_cache
 from pathlib import Path
 
+# Raspberry Pi firmware settings file
+BOOT_CONFIG = "/boot/config.txt"
+
+# Read once per process
+_OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
+
+# Original upper-case section attribute names mapped to their lazy properties
+_SECTION_ALIASES = {
+    "AI_CONFIG": "ai_config",
+    "MADAME_LEOTA_PERSONALITY": "personality",
+    "AUDIO_CONFIG": "audio_config",
+    "VIDEO_CONFIG": "video_config",
+    "PROJECTION_CONFIG": "projection_config",
+    "SYSTEM_CONFIG": "system_config",
+    "PI_CONFIG": "pi_config"
+}
+
 class Config:
     """Configuration class for Madame Leota"""
     
     def __init__(self):
-        # Project paths
+        # Project paths (directories are created on first access)
         self.PROJECT_ROOT = Path(__file__).parent
-        self.ASSETS_DIR = self.PROJECT_ROOT / "assets"
-        self.VIDEOS_DIR = self.ASSETS_DIR / "videos"
-        self.AUDIO_DIR = self.ASSETS_DIR / "audio"
-        self.MODELS_DIR = self.PROJECT_ROOT / "models"
-        self.LOGS_DIR = self.PROJECT_ROOT / "logs"
-        
-        # Create directories if they don't exist
-        for directory in [self.ASSETS_DIR, self.VIDEOS_DIR, self.AUDIO_DIR, 
-                         self.MODELS_DIR, self.LOGS_DIR]:
+        self._dir_snapshots = {}
+    
+    def __getattr__(self, name):
+        # Keep the original upper-case section attributes working
+        section = _SECTION_ALIASES.get(name)
+        if section is None:
+            raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+        return getattr(self, section)
+    
+    def _existing_dirs(self, parent: Path) -> set:
+        """Names of subdirectories of parent, scanned once"""
+        if parent not in self._dir_snapshots:
+            try:
+                with os.scandir(parent) as entries:
+                    self._dir_snapshots[parent] = {e.name for e in entries if e.is_dir()}
+            except FileNotFoundError:
+                self._dir_snapshots[parent] = set()
+        return self._dir_snapshots[parent]
+    
+    def _ensure_dir(self, directory: Path) -> Path:
+        """Create a directory if it doesn't exist"""
+        existing = self._existing_dirs(directory.parent)
+        if directory.name not in existing:
             directory.mkdir(parents=True, exist_ok=True)
-        
-        # AI Configuration
-        self.AI_CONFIG = {
+            existing.add(directory.name)
+        return directory
+    
+    @cached_property
+    def ASSETS_DIR(self):
+        """Assets directory"""
+        return self._ensure_dir(self.PROJECT_ROOT / "assets")
+    
+    @cached_property
+    def VIDEOS_DIR(self):
+        """Video files directory"""
+        return self._ensure_dir(self.ASSETS_DIR / "videos")
+    
+    @cached_property
+    def AUDIO_DIR(self):
+        """Audio files directory"""
+        return self._ensure_dir(self.ASSETS_DIR / "audio")
+    
+    @cached_property
+    def MODELS_DIR(self):
+        """AI and speech models directory"""
+        return self._ensure_dir(self.PROJECT_ROOT / "models")
+    
+    @cached_property
+    def LOGS_DIR(self):
+        """Log files directory"""
+        return self._ensure_dir(self.PROJECT_ROOT / "logs")
+    
+    @cached_property
+    def ai_config(self):
+        """AI Configuration"""
+        return {
             "model_type": "local",  # "local" or "api"
             "local_model": "llama-2-7b-chat.gguf",
-            "api_key": os.getenv("OPENAI_API_KEY", ""),
-            "max_tokens": 150,
+            "quant": "Q4_K_M",  # GGUF quantization to prefer; Q4_K_M suits the Pi
+            "threads": os.cpu_count() or 4,
+            "context_length": 512,
+            "api_key": _OPENAI_API_KEY,
+            "max_tokens": 60,  # Mystical replies rarely need more
+            "min_tokens": 20,  # Stop at the first sentence end after this many tokens
             "temperature": 0.8,
             "top_p": 0.9
         }
-        
-        # Madame Leota Personality
-        self.MADAME_LEOTA_PERSONALITY = {
+    
+    @cached_property
+    def personality(self):
+        """Madame Leota Personality"""
+        return {
             "name": "Madame Leota",
             "style": "mystical fortune teller",
             "tone": "mysterious, wise, slightly dramatic",
-            "greetings": [
+            "greetings": (
                 "Welcome, seeker of the unknown... I am Madame Leota, and I sense you have questions about your future.",
                 "Ah, the crystal ball reveals a visitor... Come closer, let me read your destiny.",
                 "Greetings, child of fate... I am Madame Leota, and I shall peer into the mists of time for you."
-            ],
-            "farewells": [
+            ),
+            "farewells": (
                 "The mists are clearing... Your fortune has been revealed. Return when you seek more answers.",
                 "The crystal ball grows dim... Your destiny awaits. Farewell, seeker of truth.",
                 "The spirits bid you farewell... Remember, the future is not set in stone. Goodbye, dear one."
-            ],
+            ),
             "fortune_templates": {
-                "love": "I see love in your future... {details}",
-                "career": "The stars align for your career... {details}",
-                "wealth": "Fortune smiles upon your financial path... {details}",
-                "general": "The crystal ball shows... {details}"
+                "love": "I see love in your future... $details",
+                "career": "The stars align for your career... $details",
+                "wealth": "Fortune smiles upon your financial path... $details",
+                "general": "The crystal ball shows... $details"
             }
         }
-        
-        # Audio Configuration
-        self.AUDIO_CONFIG = {
+    
+    @cached_property
+    def fortune_formatters(self):
+        """Fortune templates compiled once into substitute callables"""
+        return {
+            fortune_type: string.Template(template).substitute
+            for fortune_type, template in self.personality["fortune_templates"].items()
+        }
+    
+    @cached_property
+    def audio_config(self):
+        """Audio Configuration"""
+        return {
             "sample_rate": 16000,
             "chunk_size": 1024,
             "channels": 1,
             "format": "int16",
             "language": "en-US",
+            "vosk_model": "vosk-small-en",  # Offline STT model under models/
+            "vosk_min_confidence": 0.6,  # Below this, fall back to Google
+            "phrase_time_limit": 15,  # Seconds; longest single utterance captured
             "voice_speed": 0.9,
             "voice_volume": 0.8
         }
-        
-        # Video Configuration
-        self.VIDEO_CONFIG = {
+    
+    @cached_property
+    def video_config(self):
+        """Video Configuration"""
+        return {
             "projection_width": 1920,
             "projection_height": 1080,
             "fps": 30,
             "video_loop": True,
             "animation_smoothness": 0.8,
             "face_detection": True,
+            "preload_budget_mb": 512,  # Longer clips are streamed from disk instead
+            "face_detect_interval": 5,  # Frames between face detections
+            "face_cascade": "lbp",  # "lbp" (faster) or "haar"
             "overlay_opacity": 0.9
         }
-        
-        # Projection Configuration
-        self.PROJECTION_CONFIG = {
+    
+    @cached_property
+    def projection_config(self):
+        """Projection Configuration"""
+        return {
             "display_mode": "fullscreen",  # "fullscreen" or "windowed"
             "aspect_ratio": "16:9",
             "brightness": 1.0,
             "contrast": 1.0,
-            "gamma": 1.0
+            "gamma": 1.0,
+            "gpu_video": False  # Draw video through an SDL2 renderer texture (GPU scaling)
         }
-        
-        # System Configuration
-        self.SYSTEM_CONFIG = {
+    
+    @cached_property
+    def system_config(self):
+        """System Configuration"""
+        return {
             "debug_mode": False,
             "log_level": "INFO",
             "auto_start": False,
@@ -97,10 +193,13 @@ class Config:
             "save_conversations": True,
             "conversation_log": self.LOGS_DIR / "conversations.log"
         }
-        
-        # Raspberry Pi specific optimizations
-        self.PI_CONFIG = {
+    
+    @cached_property
+    def pi_config(self):
+        """Raspberry Pi specific optimizations"""
+        return {
             "cpu_throttle_temp": 80,  # Celsius
+            "configure_display": True,  # Keep /boot/config.txt in sync with these settings
             "gpu_mem": 128,  # MB
             "overclock": False,
             "hdmi_force_hotplug": True,
@@ -111,37 +210,108 @@ class Config:
     
     def get_ai_config(self):
         """Get AI configuration"""
-        return self.AI_CONFIG
+        return self.ai_config
     
     def get_personality(self):
         """Get Madame Leota's personality settings"""
-        return self.MADAME_LEOTA_PERSONALITY
+        return self.personality
+    
+    def get_fortune_formatters(self):
+        """Get compiled fortune template formatters"""
+        return self.fortune_formatters
     
     def get_audio_config(self):
         """Get audio configuration"""
-        return self.AUDIO_CONFIG
+        return self.audio_config
     
     def get_video_config(self):
         """Get video configuration"""
-        return self.VIDEO_CONFIG
+        return self.video_config
     
     def get_projection_config(self):
         """Get projection configuration"""
-        return self.PROJECTION_CONFIG
+        return self.projection_config
     
     def get_system_config(self):
         """Get system configuration"""
-        return self.SYSTEM_CONFIG
+        return self.system_config
     
     def get_pi_config(self):
         """Get Raspberry Pi specific configuration"""
-        return self.PI_CONFIG
+        return self.pi_config
+    
+    @cached_property
+    def _sections(self):
+        """Updatable configuration sections by name"""
+        return {
+            "ai": self.ai_config,
+            "audio": self.audio_config,
+            "video": self.video_config,
+            "projection": self.projection_config,
+            "system": self.system_config,
+            "pi": self.pi_config
+        }
+    
+    def resolve_sections(self):
+        """Resolve every lazy section and directory up front"""
+        # cached_property is not locked on Python 3.12+; resolve before sharing across threads
+        for name, attr in vars(type(self)).items():
+            if isinstance(attr, cached_property):
+                getattr(self, name)
+        return self
     
     def update_config(self, section, key, value):
         """Update a configuration value"""
-        if hasattr(self, section.upper() + "_CONFIG"):
-            config_dict = getattr(self, section.upper() + "_CONFIG")
-            if key in config_dict:
-                config_dict[key] = value
-                return True
+        config_dict = self._sections.get(section.lower())
+        if config_dict is not None and key in config_dict:
+            config_dict[key] = value
+            return True
         return False
+
+
+@lru_cache(maxsize=1)
+def get_config():
+    """Get the process-wide Config instance"""
+    return Config()
+
+
+def update_boot_config(settings, remove=()):
+    """Set and comment out /boot/config.txt keys in one atomic replace; returns False if nothing changed"""
+    with open(BOOT_CONFIG) as f:
+        original = f.read()
+    
+    text = original
+    for key, value in settings.items():
+        line = f"{key}={value}"
+        # Replace an active setting, else re-enable a commented-out one, else append
+        for pattern in (rf"^\s*{re.escape(key)}=.*$", rf"^#\s*{re.escape(key)}=.*$"):
+            text, count = re.subn(pattern, line, text, count=1, flags=re.MULTILINE)
+            if count:
+                break
+        else:
+            text = text.rstrip("\n") + f"\n{line}\n"
+    
+    # Keys that no longer apply are commented out so the firmware ignores them
+    for key in remove:
+        text = re.sub(rf"^(\s*{re.escape(key)}=)", r"#\1", text, flags=re.MULTILINE)
+    
+    if text == original:
+        return False
+    
+    # Stage the new file beside the target so the final rename stays on one filesystem
+    boot_dir = os.path.dirname(BOOT_CONFIG)
+    if os.access(boot_dir, os.W_OK):
+        fd, temp_path = tempfile.mkstemp(prefix="config.txt.", dir=boot_dir, text=True)
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        # mkstemp creates the file 0600; keep the original permissions
+        shutil.copymode(BOOT_CONFIG, temp_path)
+        os.replace(temp_path, BOOT_CONFIG)
+    else:
+        staged = BOOT_CONFIG + ".new"
+        mode = f"{stat.S_IMODE(os.stat(BOOT_CONFIG).st_mode):o}"
+        subprocess.run(["sudo", "tee", staged], input=text, text=True, check=True, capture_output=True)
+        subprocess.run(["sudo", "chmod", mode, staged], check=True, capture_output=True)
+        subprocess.run(["sudo", "mv", staged, BOOT_CONFIG], check=True, capture_output=True)
+    
+    return True
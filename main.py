@@ -5,33 +5,51 @@ Main application entry point
 """
 
 import os
+import re
 import sys
-import time
+import queue
 import logging
+import importlib
+from concurrent.futures import ThreadPoolExecutor
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
 
 # Add project root to path
 project_root = Path(__file__).parent
 sys.path.insert(0, str(project_root))
 
-# Import our modules
+# Import our modules (subsystems are imported in initialize_components)
 try:
-    from ai.chat import MadameLeotaAI
-    from audio.speech_rec import SpeechRecognizer
-    from audio.speech_synth import SpeechSynthesizer
-    from video.projection import ProjectionManager
-    from video.animation import FacialAnimator
-    from config import Config
+    from config import get_config
 except ImportError as e:
     print(f"Error importing modules: {e}")
     print("Please run 'python setup.py' first to install dependencies")
     sys.exit(1)
 
+# Whole words that end the session
+_EXIT_WORDS = frozenset({"goodbye", "bye", "exit", "quit", "stop"})
+_WORD_RE = re.compile(r"[a-z]+")
+
+# Components constructed in parallel: (attribute, module, class, label)
+_COMPONENTS = (
+    ("ai", "ai.chat", "MadameLeotaAI", "AI system"),
+    ("speech_rec", "audio.speech_rec", "SpeechRecognizer", "speech recognition"),
+    ("animator", "video.animation", "FacialAnimator", "facial animation")
+)
+
+# Components that initialize SDL, constructed in order on the calling thread. SDL init
+# is not thread-safe, and the mixer must be pre-configured before pygame.init()
+# would start it with default settings.
+_SDL_COMPONENTS = (
+    ("speech_synth", "audio.speech_synth", "SpeechSynthesizer", "speech synthesis"),
+    ("projection", "video.projection", "ProjectionManager", "projection system")
+)
+
 class MadameLeotaFortuneTeller:
     """Main fortune teller application"""
     
     def __init__(self):
-        self.config = Config()
+        self.config = get_config()
         self.ai = None
         self.speech_rec = None
         self.speech_synth = None
@@ -39,47 +57,66 @@ class MadameLeotaFortuneTeller:
         self.animator = None
         self.running = False
         
-        # Setup logging
+        # Setup logging; records are queued and written by a background listener
+        log_queue = queue.SimpleQueue()
+        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+        handlers = (
+            logging.FileHandler(self.config.LOGS_DIR / "madame_leota.log", delay=True),
+            logging.StreamHandler()
+        )
+        for handler in handlers:
+            handler.setFormatter(formatter)
+        
+        self._log_listener = QueueListener(log_queue, *handlers)
+        self._log_listener.start()
+        
+        log_level = self.config.get_system_config()["log_level"]
         logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler('logs/madame_leota.log'),
-                logging.StreamHandler()
-            ]
+            level=getattr(logging, log_level.upper(), logging.INFO),
+            format='%(message)s',
+            handlers=[QueueHandler(log_queue)]
         )
         self.logger = logging.getLogger(__name__)
     
+    def _create_component(self, module_name, class_name, label):
+        """Import and construct one component, returning None on failure"""
+        try:
+            component_class = getattr(importlib.import_module(module_name), class_name)
+            component = component_class(self.config)
+            self.logger.info(f"✓ {label[:1].upper()}{label[1:]} initialized")
+            return component
+        except Exception as e:
+            self.logger.error(f"Failed to initialize {label}: {e}")
+            return None
+    
     def initialize_components(self):
         """Initialize all system components"""
-        try:
-            self.logger.info("Initializing Madame Leota system...")
-            
-            # Initialize AI
-            self.ai = MadameLeotaAI(self.config)
-            self.logger.info("✓ AI system initialized")
-            
-            # Initialize speech recognition
-            self.speech_rec = SpeechRecognizer(self.config)
-            self.logger.info("✓ Speech recognition initialized")
-            
-            # Initialize speech synthesis
-            self.speech_synth = SpeechSynthesizer(self.config)
-            self.logger.info("✓ Speech synthesis initialized")
-            
-            # Initialize projection system
-            self.projection = ProjectionManager(self.config)
-            self.logger.info("✓ Projection system initialized")
-            
-            # Initialize facial animation
-            self.animator = FacialAnimator(self.config)
-            self.logger.info("✓ Facial animation initialized")
+        self.logger.info("Initializing Madame Leota system...")
+        
+        # Model loading and device setup overlap in worker threads; the lazy config
+        # sections are resolved here first so the workers only read them
+        self.config.resolve_sections()
+        with ThreadPoolExecutor(max_workers=len(_COMPONENTS)) as executor:
+            futures = {
+                attr: executor.submit(self._create_component, *spec)
+                for attr, *spec in _COMPONENTS
+            }
             
-            return True
+            for attr, *spec in _SDL_COMPONENTS:
+                setattr(self, attr, self._create_component(*spec))
             
-        except Exception as e:
-            self.logger.error(f"Failed to initialize components: {e}")
-            return False
+            for attr, future in futures.items():
+                setattr(self, attr, future.result())
+        
+        # Drive the animation from the synthesized audio and show it on the projection
+        if self.animator:
+            if self.projection:
+                self.animator.projection_manager = self.projection
+            if self.speech_synth:
+                self.speech_synth.on_audio_chunk(self.animator.on_audio_level)
+        
+        # Projection and animation are optional; the conversation needs the rest
+        return all((self.ai, self.speech_rec, self.speech_synth))
     
     def start_session(self):
         """Start a new fortune telling session"""
@@ -87,7 +124,7 @@ class MadameLeotaFortuneTeller:
         
         # Welcome message
         welcome_msg = self.ai.get_welcome_message()
-        self.logger.info(f"Welcome message: {welcome_msg}")
+        self.logger.info("Welcome message: %s", welcome_msg)
         
         # Speak and animate welcome
         self.speak_and_animate(welcome_msg)
@@ -106,21 +143,20 @@ class MadameLeotaFortuneTeller:
                 user_input = self.speech_rec.listen_for_speech()
                 
                 if user_input:
-                    self.logger.info(f"User said: {user_input}")
-                    
-                    # Generate AI response
-                    response = self.ai.get_response(user_input)
-                    self.logger.info(f"AI response: {response}")
-                    
-                    # Speak and animate response
-                    self.speak_and_animate(response)
+                    self.logger.info("User said: %s", user_input)
                     
-                    # Check for exit commands
-                    if any(word in user_input.lower() for word in ['goodbye', 'bye', 'exit', 'quit', 'stop']):
+                    # Check for exit commands before spending an AI call; end_session says farewell
+                    words = _WORD_RE.findall(user_input.lower())
+                    if _EXIT_WORDS.intersection(words):
                         self.logger.info("User requested to end session")
                         break
-                
-                time.sleep(0.1)  # Small delay to prevent CPU spinning
+                    
+                    # Generate, speak and animate the response sentence by sentence
+                    response = self.stream_and_animate(self.ai.stream_response(user_input))
+                    self.logger.info("AI response: %s", response)
+                    if self.logger.isEnabledFor(logging.DEBUG):
+                        self.logger.debug("Turn: %d words in, %d words out",
+                                          len(user_input.split()), len(response.split()))
                 
             except KeyboardInterrupt:
                 self.logger.info("Keyboard interrupt received")
@@ -132,29 +168,39 @@ class MadameLeotaFortuneTeller:
     def speak_and_animate(self, text):
         """Speak text while animating facial expressions"""
         try:
-            # Start speech synthesis
+            # Start speech synthesis; its audio levels drive the animation
             self.speech_synth.speak(text, blocking=False)
             
-            # Start facial animation
-            self.animator.animate_speech(len(text) * 0.1)  # Rough timing estimate
-            
             # Wait for speech to complete
-            while self.speech_synth.is_speaking():
-                time.sleep(0.1)
-            
-            # Stop animation
-            self.animator.stop_animation()
+            self.speech_synth.wait_until_done(timeout=len(text) * 0.2)
             
         except Exception as e:
             self.logger.error(f"Error in speak_and_animate: {e}")
     
+    def stream_and_animate(self, sentences):
+        """Speak sentences as they are generated while animating facial expressions"""
+        spoken = []
+        try:
+            for sentence in sentences:
+                # Queue speech so synthesis overlaps generation of the next sentence
+                self.speech_synth.queue_speech(sentence)
+                spoken.append(sentence)
+            
+            # Wait for speech to complete
+            self.speech_synth.wait_until_done(timeout=sum(map(len, spoken)) * 0.2)
+            
+        except Exception as e:
+            self.logger.error(f"Error in stream_and_animate: {e}")
+        
+        return " ".join(spoken)
+    
     def end_session(self):
         """End the current session"""
         self.logger.info("Ending fortune telling session...")
         
         # Farewell message
         farewell_msg = self.ai.get_farewell_message()
-        self.logger.info(f"Farewell message: {farewell_msg}")
+        self.logger.info("Farewell message: %s", farewell_msg)
         
         # Speak and animate farewell
         self.speak_and_animate(farewell_msg)
@@ -173,6 +219,9 @@ class MadameLeotaFortuneTeller:
             self.projection.clear_display()
         
         self.logger.info("Cleanup completed")
+        
+        # Flush queued log records
+        self._log_listener.stop()
     
     def run(self):
         """Main run method"""
@@ -8,17 +8,51 @@ import sys
 import subprocess
 import platform
 
-def install_requirements():
+from config import BOOT_CONFIG, get_config, update_boot_config
+
+def pip_install(*args):
+    """Run pip install with the project's wheel preferences"""
+    # Prefer prebuilt wheels over compiling native packages from source
+    command = [
+        sys.executable, "-m", "pip", "install",
+        "--prefer-binary",
+        "--upgrade-strategy", "only-if-needed",
+        *args
+    ]
+    
+    # piwheels hosts ARM wheels for the Raspberry Pi
+    if platform.machine().startswith(("arm", "aarch64")):
+        command += ["--extra-index-url", "https://www.piwheels.org/simple"]
+    
+    subprocess.check_call(command)
+
+def install_requirements(requirements_file="requirements.txt"):
     """Install Python dependencies"""
-    print("Installing Python dependencies...")
+    print(f"Installing Python dependencies from {requirements_file}...")
     try:
-        subprocess.check_call([sys.executable, "-m", "pip", "install", "-r", "requirements.txt"])
+        pip_install("-r", requirements_file)
         print("✓ Dependencies installed successfully")
     except subprocess.CalledProcessError as e:
         print(f"✗ Failed to install dependencies: {e}")
         return False
     return True
 
+def install_optional_requirements(requirements_file="requirements-optional.txt"):
+    """Install optional dependencies one at a time, returning those that failed"""
+    print(f"Installing optional dependencies from {requirements_file}...")
+    with open(requirements_file) as f:
+        requirements = [line.split("#", 1)[0].strip() for line in f]
+    
+    failed = []
+    for requirement in filter(None, requirements):
+        try:
+            pip_install(requirement)
+            print(f"✓ Installed {requirement}")
+        except subprocess.CalledProcessError:
+            print(f"⚠ Could not install {requirement}")
+            failed.append(requirement)
+    return failed
+
 def create_directories():
     """Create necessary directories"""
     print("Creating project directories...")
@@ -38,19 +72,21 @@ def create_directories():
 
 def setup_pi_config():
     """Configure Raspberry Pi specific settings"""
-    if platform.system() == "Linux":
+    if platform.system() == "Linux" and os.path.exists(BOOT_CONFIG):
         print("Detected Linux - configuring for Raspberry Pi...")
         try:
-            # Configure HDMI output
-            subprocess.run(["sudo", "raspi-config", "nonint", "do_hdmi_force_hotplug", "1"], 
-                         capture_output=True)
-            subprocess.run(["sudo", "raspi-config", "nonint", "do_gpu_mem", "128"], 
-                         capture_output=True)
+            pi_config = get_config().get_pi_config()
+            
+            # Configure HDMI output and GPU memory in a single edit
+            update_boot_config({
+                "hdmi_force_hotplug": int(pi_config["hdmi_force_hotplug"]),
+                "gpu_mem": pi_config["gpu_mem"]
+            })
             print("✓ Raspberry Pi configuration applied")
         except Exception as e:
             print(f"⚠ Raspberry Pi configuration failed: {e}")
     else:
-        print("Not on Linux - skipping Pi-specific configuration")
+        print("Not on a Raspberry Pi - skipping Pi-specific configuration")
 
 def main():
     print("Setting up Madame Leota AI Fortune Teller...")
@@ -60,6 +96,11 @@ def main():
         print("Setup failed. Please check the error messages above.")
         return False
     
+    # Optional accelerators; the app falls back gracefully without them
+    failed = install_optional_requirements()
+    if failed:
+        print(f"⚠ Optional dependencies not installed: {', '.join(failed)} - continuing")
+    
     create_directories()
     setup_pi_config()
     
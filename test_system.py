@@ -4,19 +4,30 @@ Test script for Madame Leota system
 Tests all major components
 """
 
+import os
 import sys
+import stat
+import tempfile
+import importlib
+from functools import lru_cache
 from pathlib import Path
 
 # Add project root to path
 project_root = Path(__file__).parent
 sys.path.insert(0, str(project_root))
 
+@lru_cache(maxsize=None)
+def _lazy(name):
+    """Import a module once, reusing it if it is already loaded"""
+    module = sys.modules.get(name)
+    return module if module is not None else importlib.import_module(name)
+
 def test_config():
     """Test configuration loading"""
     print("Testing configuration...")
     try:
-        from config import Config
-        config = Config()
+        get_config = _lazy("config").get_config
+        config = get_config()
         print("✓ Configuration loaded successfully")
         return True
     except Exception as e:
@@ -27,10 +38,10 @@ def test_ai():
     """Test AI system"""
     print("Testing AI system...")
     try:
-        from config import Config
-        from ai.chat import MadameLeotaAI
+        get_config = _lazy("config").get_config
+        MadameLeotaAI = _lazy("ai.chat").MadameLeotaAI
         
-        config = Config()
+        config = get_config()
         ai = MadameLeotaAI(config)
         
         # Test welcome message
@@ -50,10 +61,10 @@ def test_speech_synth():
     """Test speech synthesis"""
     print("Testing speech synthesis...")
     try:
-        from config import Config
-        from audio.speech_synth import SpeechSynthesizer
+        get_config = _lazy("config").get_config
+        SpeechSynthesizer = _lazy("audio.speech_synth").SpeechSynthesizer
         
-        config = Config()
+        config = get_config()
         synth = SpeechSynthesizer(config)
         
         # Test speech
@@ -72,10 +83,10 @@ def test_projection():
     """Test projection system"""
     print("Testing projection system...")
     try:
-        from config import Config
-        from video.projection import ProjectionManager
+        get_config = _lazy("config").get_config
+        ProjectionManager = _lazy("video.projection").ProjectionManager
         
-        config = Config()
+        config = get_config()
         proj = ProjectionManager(config)
         
         # Get display info
@@ -94,10 +105,10 @@ def test_animation():
     """Test animation system"""
     print("Testing animation system...")
     try:
-        from config import Config
-        from video.animation import FacialAnimator
+        get_config = _lazy("config").get_config
+        FacialAnimator = _lazy("video.animation").FacialAnimator
         
-        config = Config()
+        config = get_config()
         anim = FacialAnimator(config)
         
         # Get animation status
@@ -109,6 +120,46 @@ def test_animation():
         print(f"✗ Animation test failed: {e}")
         return False
 
+def test_boot_config():
+    """Test /boot/config.txt editing against a temporary file"""
+    print("Testing boot config editing...")
+    config_module = _lazy("config")
+    original_path = config_module.BOOT_CONFIG
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "config.txt")
+            with open(path, "w") as f:
+                f.write("gpu_mem=64\n#hdmi_force_hotplug=1\naudio_pwm_mode=2\n")
+            os.chmod(path, 0o644)
+            config_module.BOOT_CONFIG = path
+            
+            changed = config_module.update_boot_config(
+                {"gpu_mem": 128, "hdmi_force_hotplug": 1, "hdmi_mode": 16},
+                remove=("audio_pwm_mode",)
+            )
+            with open(path) as f:
+                text = f.read()
+            
+            # Replaced, re-enabled, appended and commented out in one pass
+            assert changed, "expected a change"
+            assert text == "gpu_mem=128\nhdmi_force_hotplug=1\n#audio_pwm_mode=2\nhdmi_mode=16\n", text
+            assert stat.S_IMODE(os.stat(path).st_mode) == 0o644, "file mode not preserved"
+            
+            # Applying the same settings again leaves the file alone
+            assert not config_module.update_boot_config(
+                {"gpu_mem": 128, "hdmi_force_hotplug": 1, "hdmi_mode": 16},
+                remove=("audio_pwm_mode",)
+            ), "expected no change"
+            assert os.listdir(tmp) == ["config.txt"], "temporary file left behind"
+        
+        print("✓ Boot config editing working")
+        return True
+    except Exception as e:
+        print(f"✗ Boot config test failed: {e}")
+        return False
+    finally:
+        config_module.BOOT_CONFIG = original_path
+
 def main():
     """Run all tests"""
     print("🔮 Madame Leota System Test 🔮")
@@ -119,7 +170,8 @@ def main():
         test_ai,
         test_speech_synth,
         test_projection,
-        test_animation
+        test_animation,
+        test_boot_config
     ]
     
     passed = 0
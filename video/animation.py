@@ -5,6 +5,7 @@ Handles video-based facial animation and effects
 """
 
 import logging
+import queue
 import time
 import threading
 from typing import Optional, List
@@ -17,6 +18,133 @@ try:
 except ImportError:
     OPENCV_AVAILABLE = False
 
+try:
+    import pygame
+    PYGAME_AVAILABLE = True
+except ImportError:
+    PYGAME_AVAILABLE = False
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# Audio levels below this hold the current frame instead of advancing
+_QUIET_LEVEL = 0.1
+
+# Decoded frames queued ahead of playback when streaming from disk
+_STREAM_QUEUE_SIZE = 4
+
+# Frames are downscaled to this height before face detection
+_DETECT_HEIGHT = 480
+
+# Overlay sizes are rounded up to this many pixels to bound the overlay cache
+_OVERLAY_QUANTUM = 8
+_OVERLAY_CACHE_SIZE = 64
+
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _blend_overlay(dst, x, y, w, h, alpha):
+        """Generate the mystical rainbow and blend it into dst[y:y+h, x:x+w] in one pass"""
+        beta = 1.0 - alpha
+        s = 100.0 / 255.0
+        v = 30.0
+        for i in prange(h):
+            for j in range(w):
+                # Same colors as the HSV2RGB overlay: hue (i+j) % 180, saturation 100, value 30
+                hue = ((i + j) % 180) / 30.0
+                sector = int(hue)
+                f = hue - sector
+                p = v * (1.0 - s)
+                q = v * (1.0 - s * f)
+                t = v * (1.0 - s * (1.0 - f))
+                if sector == 0:
+                    r, g, b = v, t, p
+                elif sector == 1:
+                    r, g, b = q, v, p
+                elif sector == 2:
+                    r, g, b = p, v, t
+                elif sector == 3:
+                    r, g, b = p, q, v
+                elif sector == 4:
+                    r, g, b = t, p, v
+                else:
+                    r, g, b = v, p, q
+                
+                dst[y + i, x + j, 0] = int(beta * dst[y + i, x + j, 0] + alpha * r + 0.5)
+                dst[y + i, x + j, 1] = int(beta * dst[y + i, x + j, 1] + alpha * g + 0.5)
+                dst[y + i, x + j, 2] = int(beta * dst[y + i, x + j, 2] + alpha * b + 0.5)
+
+def _prepare_frame(frame, display_size, dst=None):
+    """Convert a decoded BGR frame to display-sized RGB, optionally into dst"""
+    if frame.shape[1::-1] != display_size:
+        frame = cv2.resize(frame, display_size, interpolation=cv2.INTER_LINEAR)
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=dst)
+
+
+class _FrameProducer(threading.Thread):
+    """Decodes a looping video into a small queue of display-ready frames"""
+    
+    def __init__(self, video_path: str, display_size):
+        super().__init__(daemon=True)
+        self.video_path = video_path
+        self.display_size = display_size
+        self.frames = queue.Queue(maxsize=_STREAM_QUEUE_SIZE)
+        self._stop_event = threading.Event()
+        self.logger = logging.getLogger(__name__)
+    
+    def _open_capture(self):
+        """Open the video, asking for hardware decoding where OpenCV supports it"""
+        if hasattr(cv2, "CAP_PROP_HW_ACCELERATION"):
+            capture = cv2.VideoCapture(
+                self.video_path, cv2.CAP_ANY,
+                [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY]
+            )
+            if capture.isOpened():
+                return capture
+        return cv2.VideoCapture(self.video_path)
+    
+    def run(self):
+        capture = self._open_capture()
+        try:
+            while not self._stop_event.is_set():
+                ret, frame = capture.read()
+                if not ret:
+                    # Loop back to the start of the clip
+                    capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    ret, frame = capture.read()
+                    if not ret:
+                        break
+                
+                frame = _prepare_frame(frame, self.display_size)
+                while not self._stop_event.is_set():
+                    try:
+                        self.frames.put(frame, timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+                    
+        except Exception as e:
+            self.logger.error(f"Error streaming video frames: {e}")
+        finally:
+            capture.release()
+            # Sentinel: no more frames will follow
+            try:
+                self.frames.put_nowait(None)
+            except queue.Full:
+                pass
+    
+    def stop(self):
+        """Stop decoding and unblock the producer"""
+        self._stop_event.set()
+        try:
+            while True:
+                self.frames.get_nowait()
+        except queue.Empty:
+            pass
+
+
 class FacialAnimator:
     """Handles facial animation for Madame Leota"""
     
@@ -26,14 +154,60 @@ class FacialAnimator:
         self.video_config = config.get_video_config()
         self.video_capture = None
         self.video_frames = []
+        self._frames_tensor = None
+        self._face_boxes = None
+        self._nframes = 0
         self.current_frame = 0
         self.animation_running = False
         self.animation_thread = None
         self.video_path = None
+        self._streaming = False
+        self._display_size = (
+            self.video_config.get("projection_width", 1920),
+            self.video_config.get("projection_height", 1080)
+        )
+        self._audio_level = 0.0
+        self._overlay_cache = {}
+        self._frame_buf = None
+        
+        # Load the face detector once rather than on every frame
+        self._face_cascade = self._load_face_cascade() if OPENCV_AVAILABLE else None
+        self._use_umat = OPENCV_AVAILABLE and cv2.ocl.haveOpenCL()
+        if self._use_umat:
+            cv2.ocl.setUseOpenCL(True)
+        
+        # Per-channel HSV adjustments for create_mystical_effects: hue shift toward
+        # purple and a saturation boost, applied together with one cv2.LUT call
+        if OPENCV_AVAILABLE:
+            ramp = np.arange(256)
+            self._mystical_lut = np.dstack((
+                (ramp + 10) % 180,
+                np.minimum(np.round(ramp * 1.2), 255),
+                ramp
+            )).astype(np.uint8).reshape(256, 1, 3)
+        
+        # Faces are detected every few frames; the last region is reused in between
+        self._detect_every = max(1, self.video_config.get("face_detect_interval", 5))
+        self._frame_idx = 0
+        self._last_face = None
         
         # Load default video if available
         self._load_default_video()
     
+    def _load_face_cascade(self):
+        """Load the configured face cascade, falling back to Haar"""
+        if self.video_config.get("face_cascade", "lbp") == "lbp":
+            # OpenCV wheels only bundle Haar cascades; look in models/ first
+            for directory in (self.config.MODELS_DIR, Path(cv2.data.haarcascades)):
+                cascade = cv2.CascadeClassifier(str(directory / 'lbpcascade_frontalface_improved.xml'))
+                if not cascade.empty():
+                    self.logger.info("✓ Using LBP face cascade")
+                    return cascade
+            
+            self.logger.info("LBP face cascade not found - using Haar cascade")
+        
+        return cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    
     def _load_default_video(self):
         """Load default fortune teller video"""
         try:
@@ -89,24 +263,52 @@ class FacialAnimator:
             if not self.video_capture:
                 return
             
-            self.logger.info("Pre-loading video frames...")
             self.video_frames = []
+            self._frames_tensor = None
+            self._face_boxes = None
+            
+            # Clips whose display-sized frames exceed the memory budget are decoded
+            # on demand while animating rather than held in memory
+            width, height = self._display_size
+            frame_bytes = width * height * 3
+            budget = int(self.video_config.get("preload_budget_mb", 512) * 1024 * 1024)
+            max_frames = budget // frame_bytes
+            
+            total = int(self.video_capture.get(cv2.CAP_PROP_FRAME_COUNT))
+            self._streaming = total * frame_bytes > budget or max_frames == 0
+            if self._streaming:
+                self._nframes = 0
+                self.logger.info(f"✓ Streaming {total} frames from disk ({total * frame_bytes // 2**20} MB exceeds preload budget)")
+                return
+            
+            self.logger.info("Pre-loading video frames...")
+            
+            # Frames are decoded display-ready (projection size, RGB order) into one
+            # contiguous (N, H, W, 3) tensor; video_frames holds views into it
+            capacity = total if total > 0 else max_frames
+            tensor = np.empty((capacity, height, width, 3), dtype=np.uint8)
             
             frame_count = 0
-            while True:
+            while frame_count < capacity:
                 ret, frame = self.video_capture.read()
                 if not ret:
                     break
                 
-                self.video_frames.append(frame)
+                _prepare_frame(frame, self._display_size, dst=tensor[frame_count])
                 frame_count += 1
-                
-                # Limit memory usage on Pi
-                if frame_count > 300:  # About 10 seconds at 30fps
-                    self.logger.warning("Video too long - only loading first 300 frames")
-                    break
             
-            self.logger.info(f"✓ Loaded {len(self.video_frames)} frames")
+            if frame_count == capacity and self.video_capture.grab():
+                # Limit memory usage on Pi if the container under-reported its length
+                self.logger.warning(f"Video too long - only loading first {frame_count} frames")
+            
+            self._frames_tensor = tensor[:frame_count]
+            self.video_frames = list(self._frames_tensor)
+            self._nframes = frame_count
+            self.logger.info(f"✓ Loaded {self._nframes} frames")
+            
+            # The clip just loops, so face regions can be found once up front
+            if self.video_config.get("face_detection", True) and self._face_cascade is not None:
+                self._face_boxes = self._detect_all_faces(self._frames_tensor)
             
             # Reset video capture to beginning
             self.video_capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
@@ -114,10 +316,39 @@ class FacialAnimator:
         except Exception as e:
             self.logger.error(f"Error pre-loading frames: {e}")
             self.video_frames = []
+            self._frames_tensor = None
+            self._face_boxes = None
+            self._nframes = 0
+            self._streaming = False
     
-    def animate_speech(self, duration: float):
-        """Animate facial expressions during speech"""
-        if not self.video_frames:
+    def _detect_all_faces(self, frames):
+        """Detect the face region of every preloaded frame, keeping the last one through misses"""
+        boxes = np.zeros((len(frames), 4), dtype=np.int32)
+        last_face = None
+        
+        for i, frame in enumerate(frames):
+            last_face = self._detect_face_region(frame) or last_face
+            if last_face:
+                boxes[i] = last_face
+        
+        self.logger.info(f"✓ Face regions computed for {len(frames)} frames")
+        return boxes
+    
+    def on_audio_level(self, level: Optional[float]):
+        """Drive the animation from the level of the audio being spoken"""
+        if level is None:
+            # Speech finished
+            if self.animation_running:
+                self.stop_animation()
+            return
+        
+        self._audio_level = level
+        if not self.animation_running and (self.video_frames or self._streaming):
+            self.animate_speech()
+    
+    def animate_speech(self, duration: Optional[float] = None):
+        """Animate facial expressions during speech, until stopped if no duration is given"""
+        if not self.video_frames and not self._streaming:
             self.logger.warning("No video frames available for animation")
             return False
         
@@ -127,36 +358,74 @@ class FacialAnimator:
             
             self.animation_running = True
             self.current_frame = 0
+            if duration is not None:
+                self._audio_level = 1.0
             
             # Calculate frame rate
             fps = self.video_config.get("fps", 30)
             frame_delay = 1.0 / fps
             
             # Calculate total frames needed
-            total_frames = int(duration * fps)
+            total_frames = int(duration * fps) if duration is not None else None
             
             def animation_loop():
+                producer = None
                 try:
+                    # Pace frames with pygame's clock, or against a monotonic schedule without it
+                    clock = pygame.time.Clock() if PYGAME_AVAILABLE else None
+                    start = time.monotonic()
+                    ticks = 0
+                    
+                    def wait_for_next_frame():
+                        nonlocal ticks
+                        ticks += 1
+                        if clock:
+                            clock.tick(fps)
+                        else:
+                            time.sleep(max(0.0, start + ticks * frame_delay - time.monotonic()))
+                    
+                    # Hoist per-frame lookups out of the loop
+                    frames = self._frames_tensor
+                    nframes = self._nframes
+                    if self._streaming:
+                        producer = _FrameProducer(self.video_path, self._display_size)
+                        producer.start()
+                    face_detection = self.video_config.get("face_detection", True)
+                    apply_face_overlay = self.apply_face_overlay
+                    projection_manager = getattr(self, 'projection_manager', None)
+                    show_video_frame = projection_manager.show_video_frame if projection_manager else None
+                    
                     frame_count = 0
-                    while self.animation_running and frame_count < total_frames:
-                        if self.video_frames:
+                    while self.animation_running and (total_frames is None or frame_count < total_frames):
+                        if self._audio_level < _QUIET_LEVEL:
+                            # Hold the current frame through pauses in the audio
+                            wait_for_next_frame()
+                        elif nframes or producer:
                             # Get current frame
-                            frame = self.video_frames[self.current_frame % len(self.video_frames)]
+                            if producer:
+                                try:
+                                    frame = producer.frames.get(timeout=1.0)
+                                except queue.Empty:
+                                    continue
+                                if frame is None:
+                                    break
+                            else:
+                                frame = frames[self.current_frame]
                             
                             # Apply face overlay if enabled
-                            if self.video_config.get("face_detection", True):
-                                frame = self.apply_face_overlay(frame)
+                            if face_detection:
+                                frame = apply_face_overlay(frame)
                             
                             # Display frame
-                            if hasattr(self, 'projection_manager'):
-                                self.projection_manager.show_video_frame(frame)
+                            if show_video_frame:
+                                show_video_frame(frame)
                             
                             # Move to next frame
-                            self.current_frame += 1
+                            self.current_frame = (self.current_frame + 1) % nframes if nframes else self.current_frame + 1
                             frame_count += 1
                             
                             # Wait for next frame
-                            time.sleep(frame_delay)
+                            wait_for_next_frame()
                         else:
                             break
                     
@@ -166,12 +435,18 @@ class FacialAnimator:
                 except Exception as e:
                     self.logger.error(f"Error in animation loop: {e}")
                     self.animation_running = False
+                finally:
+                    if producer:
+                        producer.stop()
             
             # Start animation in background thread
             self.animation_thread = threading.Thread(target=animation_loop, daemon=True)
             self.animation_thread.start()
             
-            self.logger.info(f"✓ Animation started for {duration:.2f} seconds")
+            if duration is not None:
+                self.logger.info(f"✓ Animation started for {duration:.2f} seconds")
+            else:
+                self.logger.info("✓ Animation started")
             return True
             
         except Exception as e:
@@ -198,12 +473,25 @@ class FacialAnimator:
             if not self.video_config.get("face_detection", True):
                 return frame
             
-            # Try to detect face region
-            face_region = self._detect_face_region(frame)
+            if self._face_boxes is not None:
+                # Preloaded clips use the face region found at load time for this frame
+                box = self._face_boxes[self.current_frame]
+                face_region = box.tolist() if box[2] > 0 else None
+            else:
+                # Try to detect face region, reusing the last one between detections
+                if self._frame_idx % self._detect_every == 0:
+                    self._last_face = self._detect_face_region(frame)
+                self._frame_idx += 1
+                face_region = self._last_face
             
             if face_region:
+                # Draw on a reused copy so the preloaded frame stays clean
+                if self._frame_buf is None or self._frame_buf.shape != frame.shape:
+                    self._frame_buf = np.empty_like(frame)
+                np.copyto(self._frame_buf, frame)
+                
                 # Apply mystical effects to face region
-                frame = self._apply_mystical_effects(frame, face_region)
+                frame = self._apply_mystical_effects(self._frame_buf, face_region)
             
             return frame
             
@@ -214,25 +502,39 @@ class FacialAnimator:
     def _detect_face_region(self, frame):
         """Detect face region in frame"""
         try:
-            # Convert to grayscale for face detection
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            # Detect on a downscaled copy; cascade cost scales with pixel count
+            scale = min(1.0, _DETECT_HEIGHT / frame.shape[0])
+            if scale < 1.0:
+                small = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
+            else:
+                small = frame
             
-            # Load face cascade classifier
-            face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+            # Convert to grayscale for face detection
+            gray = cv2.cvtColor(small, cv2.COLOR_RGB2GRAY)
             
-            # Detect faces
-            faces = face_cascade.detectMultiScale(
-                gray,
-                scaleFactor=1.1,
-                minNeighbors=5,
-                minSize=(30, 30)
-            )
+            # Detect faces, through OpenCL (T-API) when a device is available
+            faces = None
+            if self._use_umat:
+                try:
+                    faces = self._face_cascade.detectMultiScale(
+                        cv2.UMat(gray), scaleFactor=1.2, minNeighbors=5, minSize=(20, 20)
+                    )
+                except cv2.error:
+                    self._use_umat = False
+            
+            if faces is None:
+                faces = self._face_cascade.detectMultiScale(
+                    gray,
+                    scaleFactor=1.2,
+                    minNeighbors=5,
+                    minSize=(20, 20)
+                )
+            faces = np.asarray(faces)
             
             if len(faces) > 0:
-                # Convert numpy array to list and find largest face
-                faces_list = faces.tolist()
-                largest_face = max(faces_list, key=lambda x: x[2] * x[3])
-                return largest_face
+                # Find largest face and map it back to full-frame coordinates
+                largest_face = faces[np.argmax(faces[:, 2] * faces[:, 3])]
+                return [int(v / scale) for v in largest_face]
             
             return None
             
@@ -245,8 +547,16 @@ class FacialAnimator:
         try:
             x, y, w, h = face_region
             
-            # Create mystical overlay
-            overlay = self._create_mystical_overlay(w, h)
+            if NUMBA_AVAILABLE and frame.ndim == 3:
+                # Fused native kernel: no overlay image is built at all
+                w = min(w, frame.shape[1] - x)
+                h = min(h, frame.shape[0] - y)
+                if w > 0 and h > 0:
+                    _blend_overlay(frame, x, y, w, h, self.video_config.get("overlay_opacity", 0.9))
+                return frame
+            
+            # Reuse the mystical overlay for this size, cropped to the face
+            overlay = self._get_mystical_overlay(w, h)[:h, :w]
             
             # Blend overlay with face region
             frame = self._blend_frames(frame, overlay, x, y)
@@ -257,28 +567,30 @@ class FacialAnimator:
             self.logger.error(f"Error applying mystical effects: {e}")
             return frame
     
+    def _get_mystical_overlay(self, width: int, height: int):
+        """Get a cached mystical overlay at least width x height in size"""
+        q = _OVERLAY_QUANTUM
+        key = (-(-width // q) * q, -(-height // q) * q, self.video_config.get("overlay_opacity", 0.9))
+        
+        overlay = self._overlay_cache.get(key)
+        if overlay is None:
+            if len(self._overlay_cache) >= _OVERLAY_CACHE_SIZE:
+                self._overlay_cache.clear()
+            overlay = self._overlay_cache[key] = self._create_mystical_overlay(key[0], key[1])
+        
+        return overlay
+    
     def _create_mystical_overlay(self, width: int, height: int):
         """Create mystical visual effects overlay"""
         try:
-            # Create a colorful, mystical overlay
-            overlay = np.zeros((height, width, 3), dtype=np.uint8)
-            
-            # Add some mystical colors and patterns
-            for i in range(height):
-                for j in range(width):
-                    # Create rainbow-like effect
-                    hue = (i + j) % 360
-                    saturation = 100
-                    value = 100
-                    
-                    # Convert HSV to BGR
-                    hsv = np.array([[[hue, saturation, value]]], dtype=np.uint8)
-                    bgr = cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
-                    
-                    overlay[i, j] = bgr[0, 0]
+            # Create a colorful, mystical overlay: a diagonal rainbow built in one pass
+            # (OpenCV hue spans 0-179; value 30 bakes in the former 0.3 transparency)
+            hsv = np.empty((height, width, 3), dtype=np.uint8)
+            hsv[..., 0] = np.add.outer(np.arange(height), np.arange(width)) % 180
+            hsv[..., 1] = 100
+            hsv[..., 2] = 30
             
-            # Apply some transparency
-            overlay = cv2.addWeighted(overlay, 0.3, np.zeros_like(overlay), 0.7, 0)
+            overlay = cv2.cvtColor(hsv, cv2.COLOR_HSV2RGB)
             
             return overlay
             
@@ -309,10 +621,9 @@ class FacialAnimator:
             alpha = self.video_config.get("overlay_opacity", 0.9)
             beta = 1.0 - alpha
             
-            base_frame[y:y+h, x:x+w] = cv2.addWeighted(
-                base_frame[y:y+h, x:x+w], beta,
-                overlay_cropped, alpha, 0
-            )
+            # Blend in place within the face region
+            roi = base_frame[y:y+h, x:x+w]
+            cv2.addWeighted(roi, beta, overlay_cropped, alpha, 0, dst=roi)
             
             return base_frame
             
@@ -326,21 +637,17 @@ class FacialAnimator:
             if not OPENCV_AVAILABLE:
                 return frame
             
-            # Apply some mystical color effects
-            frame_hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-            
-            # Enhance saturation
-            frame_hsv[:, :, 1] = cv2.multiply(frame_hsv[:, :, 1], 1.2)
+            # Apply some mystical color effects: enhance saturation and add a
+            # slight purple tint in a single pass over the HSV image
+            frame_hsv = cv2.cvtColor(frame, cv2.COLOR_RGB2HSV)
+            cv2.LUT(frame_hsv, self._mystical_lut, dst=frame_hsv)
             
-            # Add slight purple tint
-            frame_hsv[:, :, 0] = cv2.add(frame_hsv[:, :, 0], 10)
-            
-            # Convert back to BGR
-            frame_mystical = cv2.cvtColor(frame_hsv, cv2.COLOR_HSV2BGR)
+            # Convert back to RGB, reusing the HSV buffer
+            frame_mystical = cv2.cvtColor(frame_hsv, cv2.COLOR_HSV2RGB, dst=frame_hsv)
             
             # Blend with original frame
             alpha = 0.7
-            frame = cv2.addWeighted(frame, 1-alpha, frame_mystical, alpha, 0)
+            frame = cv2.addWeighted(frame, 1-alpha, frame_mystical, alpha, 0, dst=frame_mystical)
             
             return frame
             
@@ -361,7 +668,7 @@ class FacialAnimator:
     def test_animation(self) -> bool:
         """Test animation system"""
         try:
-            if not self.video_frames:
+            if not self.video_frames and not self._streaming:
                 self.logger.warning("No video frames available for testing")
                 return False
             
@@ -392,6 +699,9 @@ class FacialAnimator:
                 self.video_capture.release()
             
             self.video_frames.clear()
+            self._frames_tensor = None
+            self._face_boxes = None
+            self._nframes = 0
             self.logger.info("✓ Animation system cleaned up")
             
         except Exception as e:
@@ -405,11 +715,15 @@ class FallbackFacialAnimator:
         self.config = config
         self.logger = logging.getLogger(__name__)
     
-    def animate_speech(self, duration: float):
+    def animate_speech(self, duration: Optional[float] = None):
         """Fallback method"""
         self.logger.warning("Using fallback facial animator - no animation available")
         return False
     
+    def on_audio_level(self, level: Optional[float]):
+        """Fallback method"""
+        pass
+    
     def stop_animation(self):
         """Fallback method"""
         pass
@@ -7,7 +7,7 @@ Handles display setup and projection mapping
 import logging
 import os
 import platform
-import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Tuple
 
 try:
@@ -20,6 +20,14 @@ except ImportError:
     PYGAME_AVAILABLE = False
     OPENCV_AVAILABLE = False
 
+try:
+    from pygame._sdl2.video import Window, Renderer, Texture
+    SDL2_VIDEO_AVAILABLE = True
+except ImportError:
+    SDL2_VIDEO_AVAILABLE = False
+
+from config import BOOT_CONFIG, update_boot_config
+
 class ProjectionManager:
     """Manages display and projection for Madame Leota"""
     
@@ -27,12 +35,36 @@ class ProjectionManager:
         self.config = config
         self.logger = logging.getLogger(__name__)
         self.screen = None
+        self._display_size = None
         self.display_info = None
         self.projection_config = config.get_projection_config()
         self.pi_config = config.get_pi_config()
         
+        # Per-frame scratch buffers, allocated on first use and reused
+        self._rgb_buf = None
+        self._frame_surf = None
+        self._scaled_surf = None
+        self._effects_luts = {}
+        
+        # Optional SDL2 renderer: frames are uploaded as textures and scaled by the GPU.
+        # SDL renderers are not thread-safe, so one worker thread owns all renderer calls
+        self._renderer = None
+        self._texture = None
+        self._render_thread = None
+        
+        # Brightness/contrast/gamma applied to each frame before it is shown
+        self._fx_state = (
+            self.projection_config.get("brightness", 1.0),
+            self.projection_config.get("contrast", 1.0),
+            self.projection_config.get("gamma", 1.0)
+        )
+        self._fx_lut = None
+        self._fx_buf = None
+        
         if PYGAME_AVAILABLE:
             self._initialize_display()
+            if OPENCV_AVAILABLE and self._fx_state != (1.0, 1.0, 1.0):
+                self._fx_lut = self._effects_lut(*self._fx_state)
         else:
             self.logger.warning("Pygame not available - projection disabled")
     
@@ -61,10 +93,13 @@ class ProjectionManager:
                 height = self.projection_config.get("projection_height", 1080)
                 self.screen = pygame.display.set_mode((width, height))
                 self.logger.info(f"✓ Windowed display initialized: {width}x{height}")
+            self._display_size = self.screen.get_size()
             
             # Set window title
             pygame.display.set_caption("Madame Leota - Fortune Teller")
             
+            self._initialize_renderer()
+            
             # Clear display
             self.clear_display()
             
@@ -72,71 +107,152 @@ class ProjectionManager:
             self.logger.error(f"Failed to initialize display: {e}")
             self.screen = None
     
+    def _initialize_renderer(self):
+        """Set up the SDL2 texture path for video frames if enabled"""
+        if not self.projection_config.get("gpu_video", False):
+            return
+        
+        if not SDL2_VIDEO_AVAILABLE:
+            self.logger.warning("SDL2 video bindings not available - using surface blits")
+            return
+        
+        if self._render_thread is None:
+            self._render_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="render")
+        self._on_render_thread(self._create_renderer)
+    
+    def _on_render_thread(self, fn, *args):
+        """Run fn on the thread that owns the SDL2 renderer and wait for its result"""
+        return self._render_thread.submit(fn, *args).result()
+    
+    def _create_renderer(self):
+        """(Re)create the SDL2 renderer; runs on the render thread"""
+        self._renderer = None
+        self._texture = None
+        
+        try:
+            window = Window.from_display_module()
+            self._renderer = Renderer(window, vsync=True)
+            self.logger.info("✓ GPU video texture path enabled")
+        except Exception as e:
+            self.logger.warning(f"GPU video path unavailable - using surface blits: {e}")
+            self._renderer = None
+    
+    def _present_texture(self, pixels):
+        """Upload an (x, y) indexed RGB frame to a streaming texture and present it; runs on the render thread"""
+        size = pixels.shape[:2]
+        if self._texture is None or self._texture.get_rect().size != size:
+            self._texture = Texture(self._renderer, size, streaming=True)
+            self._frame_surf = pygame.Surface(size)
+        
+        pygame.surfarray.blit_array(self._frame_surf, pixels)
+        self._texture.update(self._frame_surf)
+        self._texture.draw()
+        self._renderer.present()
+    
+    def _fill(self, color):
+        """Fill the display with a solid color and present it"""
+        if self._renderer:
+            self._on_render_thread(self._clear_renderer, color)
+        else:
+            self.screen.fill(color)
+            pygame.display.flip()
+    
+    def _clear_renderer(self, color):
+        """Clear the renderer to a solid color and present it; runs on the render thread"""
+        self._renderer.draw_color = (*color, 255)
+        self._renderer.clear()
+        self._renderer.present()
+    
+    def _present_image(self, image):
+        """Draw a surface scaled to the window and present it; runs on the render thread"""
+        Texture.from_surface(self._renderer, image).draw()
+        self._renderer.present()
+    
+    def _release_renderer(self):
+        """Drop the SDL2 renderer and its texture; runs on the render thread"""
+        self._texture = None
+        self._renderer = None
+    
     def _configure_pi_display(self):
         """Configure Raspberry Pi specific display settings"""
         try:
+            if not self.pi_config.get("configure_display", True) or not os.path.exists(BOOT_CONFIG):
+                return
+            
             self.logger.info("Configuring Raspberry Pi display...")
             
+            settings = {
+                "hdmi_group": self.pi_config["hdmi_group"],
+                "hdmi_mode": self.pi_config["hdmi_mode"],
+                "gpu_mem": self.pi_config["gpu_mem"],
+                "dtparam=audio": "on"
+            }
+            
             # HDMI force hotplug
             if self.pi_config["hdmi_force_hotplug"]:
-                subprocess.run([
-                    "sudo", "raspi-config", "nonint", "do_hdmi_force_hotplug", "1"
-                ], capture_output=True)
-            
-            # Set HDMI group and mode
-            subprocess.run([
-                "sudo", "raspi-config", "nonint", "do_hdmi_group", 
-                str(self.pi_config["hdmi_group"])
-            ], capture_output=True)
-            
-            subprocess.run([
-                "sudo", "raspi-config", "nonint", "do_hdmi_mode", 
-                str(self.pi_config["hdmi_mode"])
-            ], capture_output=True)
-            
-            # Set GPU memory split
-            subprocess.run([
-                "sudo", "raspi-config", "nonint", "do_gpu_mem", 
-                str(self.pi_config["gpu_mem"])
-            ], capture_output=True)
-            
-            # Set audio output
+                settings["hdmi_force_hotplug"] = 1
+            
+            # Set audio output, disabling the key for the other route
             if self.pi_config["audio_output"] == "hdmi":
-                subprocess.run([
-                    "sudo", "raspi-config", "nonint", "do_audio_out", "2"
-                ], capture_output=True)
+                settings["hdmi_drive"] = 2
+                remove = ("hdmi_ignore_edid_audio",)
             else:
-                subprocess.run([
-                    "sudo", "raspi-config", "nonint", "do_audio_out", "1"
-                ], capture_output=True)
+                settings["hdmi_ignore_edid_audio"] = 1
+                remove = ("hdmi_drive",)
             
-            self.logger.info("✓ Raspberry Pi display configured")
+            if update_boot_config(settings, remove):
+                self.logger.info("✓ Raspberry Pi display configured (takes effect after reboot)")
+            else:
+                self.logger.info("✓ Raspberry Pi display already configured")
             
         except Exception as e:
             self.logger.error(f"Failed to configure Pi display: {e}")
     
     def show_video_frame(self, frame):
-        """Display a video frame on the projection surface"""
+        """Display an RGB video frame on the projection surface"""
         if not self.screen or not OPENCV_AVAILABLE:
             return False
         
         try:
-            # Convert OpenCV frame to Pygame surface
-            if len(frame.shape) == 3:
-                # BGR to RGB
-                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            else:
-                frame_rgb = frame
-            
-            # Convert to Pygame surface
-            frame_surface = pygame.surfarray.make_surface(frame_rgb.swapaxes(0, 1))
+            if len(frame.shape) == 2:
+                if self._rgb_buf is None or self._rgb_buf.shape[:2] != frame.shape:
+                    self._rgb_buf = np.empty(frame.shape + (3,), dtype=np.uint8)
+                frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2RGB, dst=self._rgb_buf)
+            
+            # Apply visual effects on the way to the screen
+            if self._fx_lut is not None:
+                if self._fx_buf is None or self._fx_buf.shape != frame.shape:
+                    self._fx_buf = np.empty_like(frame)
+                frame = cv2.LUT(frame, self._fx_lut, dst=self._fx_buf)
+            
+            # Pygame arrays are indexed (x, y); a transposed view avoids a copy
+            pixels = frame.swapaxes(0, 1)
+            display_size = self._display_size
+            
+            if self._renderer:
+                # The GPU scales the texture to the window while presenting; waiting
+                # for the render thread keeps the reused frame buffers from being
+                # overwritten before they are uploaded
+                self._on_render_thread(self._present_texture, pixels)
+                return True
             
-            # Scale to fit display
-            display_rect = self.screen.get_rect()
-            scaled_surface = pygame.transform.scale(frame_surface, display_rect.size)
+            if pixels.shape[:2] == display_size:
+                # Frame is already display-sized: write it straight into the screen
+                pygame.surfarray.blit_array(self.screen, pixels)
+            else:
+                # Copy into a reused frame surface, then scale to fit display into a
+                # reused surface of the same format
+                if self._frame_surf is None or self._frame_surf.get_size() != pixels.shape[:2]:
+                    self._frame_surf = pygame.Surface(pixels.shape[:2])
+                    self._scaled_surf = None
+                pygame.surfarray.blit_array(self._frame_surf, pixels)
+                
+                if self._scaled_surf is None or self._scaled_surf.get_size() != display_size:
+                    self._scaled_surf = pygame.Surface(display_size, 0, self._frame_surf)
+                pygame.transform.scale(self._frame_surf, display_size, self._scaled_surf)
+                self.screen.blit(self._scaled_surf, (0, 0))
             
             # Display frame
-            self.screen.blit(scaled_surface, (0, 0))
             pygame.display.flip()
             
             return True
@@ -154,12 +270,18 @@ class ProjectionManager:
             # Load image
             image = pygame.image.load(image_path)
             
-            # Scale to fit display
-            display_rect = self.screen.get_rect()
-            scaled_image = pygame.transform.scale(image, display_rect.size)
+            if self._renderer:
+                # Let the GPU scale the image to the window
+                self._on_render_thread(self._present_image, image)
+                self.logger.info(f"✓ Image displayed: {image_path}")
+                return True
+            
+            # Scale to fit display unless it already matches
+            if image.get_size() != self._display_size:
+                image = pygame.transform.scale(image, self._display_size)
             
             # Display image
-            self.screen.blit(scaled_image, (0, 0))
+            self.screen.blit(image, (0, 0))
             pygame.display.flip()
             
             self.logger.info(f"✓ Image displayed: {image_path}")
@@ -176,8 +298,7 @@ class ProjectionManager:
         
         try:
             # Fill with black
-            self.screen.fill((0, 0, 0))
-            pygame.display.flip()
+            self._fill((0, 0, 0))
             
             self.logger.info("✓ Display cleared")
             return True
@@ -209,6 +330,8 @@ class ProjectionManager:
                 )
                 self.projection_config["display_mode"] = "fullscreen"
                 self.logger.info("✓ Switched to fullscreen mode")
+            self._display_size = self.screen.get_size()
+            self._initialize_renderer()
             
             return True
             
@@ -229,6 +352,8 @@ class ProjectionManager:
                 )
             else:
                 self.screen = pygame.display.set_mode((width, height))
+            self._display_size = self.screen.get_size()
+            self._initialize_renderer()
             
             self.projection_config["projection_width"] = width
             self.projection_config["projection_height"] = height
@@ -240,41 +365,34 @@ class ProjectionManager:
             self.logger.error(f"Error setting display resolution: {e}")
             return False
     
+    def _effects_lut(self, brightness: float, contrast: float, gamma: float):
+        """Get a cached lookup table combining brightness, contrast and gamma"""
+        key = (round(brightness, 3), round(contrast, 3), round(gamma, 3))
+        table = self._effects_luts.get(key)
+        
+        if table is None:
+            # Same as convertScaleAbs (saturated |contrast * x + beta|) followed by gamma
+            ramp = np.abs(np.arange(256) * contrast + (brightness - 1.0) * 255)
+            table = np.clip(np.round(ramp), 0, 255)
+            if gamma != 1.0:
+                table = ((table.astype(np.uint8) / 255.0) ** (1.0 / gamma)) * 255
+            table = self._effects_luts[key] = table.astype(np.uint8)
+        
+        return table
+    
     def apply_visual_effects(self, brightness: float = 1.0, contrast: float = 1.0, gamma: float = 1.0):
-        """Apply visual effects for projection"""
+        """Apply visual effects for projection to subsequent video frames"""
         if not self.screen:
             return False
         
         try:
-            # Get current display surface
-            current_surface = self.screen.copy()
-            
-            # Apply effects using OpenCV if available
             if OPENCV_AVAILABLE:
-                # Convert to numpy array
-                surface_array = pygame.surfarray.array3d(current_surface)
-                
-                # Apply brightness and contrast
-                surface_array = cv2.convertScaleAbs(
-                    surface_array, 
-                    alpha=contrast, 
-                    beta=(brightness - 1.0) * 255
-                )
-                
-                # Apply gamma correction
-                if gamma != 1.0:
-                    gamma_table = np.array([
-                        ((i / 255.0) ** (1.0 / gamma)) * 255 
-                        for i in np.arange(0, 256)
-                    ]).astype("uint8")
-                    surface_array = cv2.LUT(surface_array, gamma_table)
-                
-                # Convert back to Pygame surface
-                modified_surface = pygame.surfarray.make_surface(surface_array.swapaxes(0, 1))
-                
-                # Display modified surface
-                self.screen.blit(modified_surface, (0, 0))
-                pygame.display.flip()
+                # Effects are applied to each frame in show_video_frame, not read back from the screen
+                self._fx_state = (brightness, contrast, gamma)
+                if self._fx_state == (1.0, 1.0, 1.0):
+                    self._fx_lut = None
+                else:
+                    self._fx_lut = self._effects_lut(brightness, contrast, gamma)
                 
                 self.logger.info("✓ Visual effects applied")
                 return True
@@ -298,8 +416,7 @@ class ProjectionManager:
             colors = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 255)]
             
             for color in colors:
-                self.screen.fill(color)
-                pygame.display.flip()
+                self._fill(color)
                 pygame.time.wait(1000)  # Wait 1 second
             
             # Return to black
@@ -332,6 +449,12 @@ class ProjectionManager:
     def cleanup(self):
         """Clean up projection resources"""
         try:
+            if self._render_thread:
+                # Release the renderer on the thread that created it
+                self._on_render_thread(self._release_renderer)
+                self._render_thread.shutdown()
+                self._render_thread = None
+            
             if self.screen:
                 pygame.display.quit()
                 self.logger.info("✓ Projection system cleaned up")